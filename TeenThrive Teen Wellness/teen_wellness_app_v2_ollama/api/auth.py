@@ -1,18 +1,34 @@
-import time, jwt
+import os, time, jwt, hashlib, secrets
 from passlib.context import CryptContext
 from typing import Optional
 
 JWT_SECRET = "dev-secret-change-me"
 JWT_ALG = "HS256"
-pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with a different cost are flagged by needs_rehash and upgraded on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=BCRYPT_ROUNDS,
+                   bcrypt__min_desired_rounds=BCRYPT_ROUNDS, bcrypt__max_desired_rounds=BCRYPT_ROUNDS)
 
 def hash_password(p:str)->str: return pwd.hash(p)
 def verify_password(p, h)->bool: return pwd.verify(p, h)
+def needs_rehash(h:str)->bool: return pwd.needs_update(h)
 
-def create_token(sub:str, exp:int=60*60*24):
+# Short-lived access tokens; clients renew them with a rotating refresh token via /auth/refresh
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", str(15*60)))
+REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", str(30*24*60*60)))
+# rotated tokens are kept this long so replaying one is still recognised as reuse
+REFRESH_REUSE_WINDOW = int(os.getenv("REFRESH_REUSE_WINDOW", str(7*24*60*60)))
+
+def create_token(sub:str, uid:Optional[int]=None, exp:int=ACCESS_TOKEN_TTL, fam:Optional[str]=None):
     payload = {"sub":sub, "exp":int(time.time())+exp}
+    if uid is not None: payload["uid"] = uid
+    if fam is not None: payload["fam"] = fam  # refresh-token family, for revocation
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
+def new_refresh_token() -> str: return secrets.token_urlsafe(32)
+def new_token_family() -> str: return secrets.token_hex(8)
+def hash_refresh_token(t:str) -> str: return hashlib.sha256(t.encode()).hexdigest()
+
 def decode_token(token:str)->Optional[dict]:
     try:
         return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
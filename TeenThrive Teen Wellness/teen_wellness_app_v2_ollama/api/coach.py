@@ -0,0 +1,226 @@
+"""Coach chat backed by a shared Ollama host.
+
+All chat traffic from the API goes through one pooled httpx.AsyncClient and a
+FairScheduler. The scheduler runs at most COACH_CONCURRENCY generations at a
+time and queues the rest per user, handing each freed slot to the next user in
+round-robin order. A teen sending several messages in a row therefore can't
+starve others. admit() reserves the slot or queue place when the request
+arrives, so a full queue is refused up front with 503 + Retry-After.
+Replies are relayed as Server-Sent Events:
+
+    data: {"delta": "..."}           one per streamed chunk
+    event: done / data: {...}        final stats from Ollama
+    event: error / data: {"detail"}  model host failure mid-stream
+
+COACH_MODELS lists the models to use, smallest first. route() sends a
+conversation whose opening question is short and simple to the smallest one
+and everything else to the largest; follow-ups stay on that model. A
+background task keeps every listed model loaded with keep-alive pings, so no
+user request pays the model load after an idle period.
+"""
+import asyncio, json, os, re, time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Optional
+import httpx
+from fastapi import HTTPException
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434").rstrip("/")
+COACH_MODEL = os.getenv("COACH_MODEL", "mistral:latest")
+COACH_MODELS = [m.strip() for m in os.getenv("COACH_MODELS", COACH_MODEL).split(",") if m.strip()]  # smallest first
+COACH_SMALL_MAX_WORDS = int(os.getenv("COACH_SMALL_MAX_WORDS", "20"))
+COACH_KEEP_ALIVE = os.getenv("COACH_KEEP_ALIVE", "30m")  # how long Ollama keeps a model loaded after a request
+COACH_WARM_INTERVAL = float(os.getenv("COACH_WARM_INTERVAL", "240"))  # seconds between warm pings; 0 disables
+COACH_CONCURRENCY = int(os.getenv("COACH_CONCURRENCY", "2"))
+COACH_QUEUE_DEPTH = int(os.getenv("COACH_QUEUE_DEPTH", "32"))
+COACH_MAX_PER_USER = int(os.getenv("COACH_MAX_PER_USER", "2"))
+COACH_READ_TIMEOUT = float(os.getenv("COACH_READ_TIMEOUT", "120"))
+
+class Ticket:
+    """A place held in the scheduler: a running slot, or a queue entry until a slot is handed over.
+
+    `async with ticket:` waits for the slot and frees it afterwards. release()
+    is idempotent, so every exit path can call it.
+    """
+
+    def __init__(self, scheduler: "FairScheduler", user_id: int, fut: Optional[asyncio.Future] = None):
+        self.scheduler, self.user_id, self.fut, self.released = scheduler, user_id, fut, False
+
+    async def __aenter__(self):
+        if self.fut is not None:
+            try:
+                await self.fut  # resolved by _release, which hands over its slot
+            except BaseException:
+                self.release(); raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def release(self):
+        if self.released: return
+        self.released = True
+        if self.fut is None or (self.fut.done() and not self.fut.cancelled()): self.scheduler._release(self.user_id)
+        else: self.scheduler._drop(self.user_id, self.fut)
+
+class FairScheduler:
+    def __init__(self, slots: int, queue_depth: int, per_user: int, retry_after: int = 5):
+        self.slots, self.queue_depth, self.per_user = max(1, slots), max(0, queue_depth), max(1, per_user)
+        self.retry_after = retry_after
+        self.active = self.waiting = self.rejected = 0
+        self._queues: "OrderedDict[int, deque]" = OrderedDict()
+
+    def admit(self, user_id: int) -> Ticket:
+        """Take a slot or a queue place right away, or refuse before the response starts."""
+        if self.active < self.slots and not self.waiting:
+            self.active += 1
+            return Ticket(self, user_id)
+        if self.waiting >= self.queue_depth:
+            self.rejected += 1
+            raise HTTPException(503, "Coach is busy, retry shortly", headers={"Retry-After": str(self.retry_after)})
+        if len(self._queues.get(user_id, ())) >= self.per_user:
+            self.rejected += 1
+            raise HTTPException(429, "Wait for your previous question to finish", headers={"Retry-After": str(self.retry_after)})
+        fut = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(fut)
+        self.waiting += 1
+        return Ticket(self, user_id, fut)
+
+    def _drop(self, user_id: int, fut):
+        q = self._queues.get(user_id)
+        if q and fut in q:
+            q.remove(fut); self.waiting -= 1
+            if not q: del self._queues[user_id]
+
+    def _release(self, user_id: int):
+        # the user that just finished yields to anyone else who is waiting
+        if user_id in self._queues and len(self._queues) > 1: self._queues.move_to_end(user_id)
+        while self._queues:
+            user_id, q = next(iter(self._queues.items()))
+            fut = q.popleft(); self.waiting -= 1
+            if q: self._queues.move_to_end(user_id)  # round-robin: this user goes to the back
+            else: del self._queues[user_id]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {"slots": self.slots, "active": self.active, "waiting": self.waiting,
+                "users_waiting": len(self._queues), "rejected": self.rejected}
+
+scheduler = FairScheduler(COACH_CONCURRENCY, COACH_QUEUE_DEPTH, COACH_MAX_PER_USER)
+_client: Optional[httpx.AsyncClient] = None
+
+def client() -> httpx.AsyncClient:
+    # created on first use so it binds to the server's event loop
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(base_url=OLLAMA_URL,
+                                    timeout=httpx.Timeout(10.0, read=COACH_READ_TIMEOUT),
+                                    limits=httpx.Limits(max_connections=COACH_CONCURRENCY * 2,
+                                                        max_keepalive_connections=COACH_CONCURRENCY))
+    return _client
+
+async def aclose():
+    global _client, _warmer
+    if _warmer is not None:
+        _warmer.cancel(); _warmer = None
+    if _client is not None:
+        await _client.aclose(); _client = None
+
+# questions that ask for reasoning or planning go to the large model whatever their length
+_COMPLEX = re.compile(r"\b(why|explain|plan|schedule|compare|difference|week|routine|program|injur\w*|medical)\b", re.I)
+
+def route(question: str) -> str:
+    if len(COACH_MODELS) == 1: return COACH_MODELS[0]
+    simple = len(question.split()) <= COACH_SMALL_MAX_WORDS and not _COMPLEX.search(question)
+    return COACH_MODELS[0] if simple else COACH_MODELS[-1]
+
+# model -> {"loaded", "last_warm", "warm_ms", "error"} as last seen by the warmer
+model_state = {m: {"loaded": False, "last_warm": None, "warm_ms": None, "error": None} for m in COACH_MODELS}
+_warmer: Optional[asyncio.Task] = None
+
+async def warm(model: str):
+    """Load `model` (no-op if resident) and extend its keep-alive; an empty prompt generates nothing."""
+    st = model_state.setdefault(model, {"loaded": False, "last_warm": None, "warm_ms": None, "error": None})
+    t0 = time.perf_counter()
+    try:
+        r = await client().post("/api/generate", json={"model": model, "prompt": "", "keep_alive": COACH_KEEP_ALIVE})
+        r.raise_for_status()
+        st.update(loaded=True, last_warm=time.time(), warm_ms=round((time.perf_counter() - t0) * 1000), error=None)
+    except httpx.HTTPError as e:
+        st.update(loaded=False, error=type(e).__name__)
+
+async def refresh_loaded():
+    """Mark which configured models the host currently has in memory."""
+    try:
+        r = await client().get("/api/ps"); r.raise_for_status()
+        resident = {m.get("name") for m in r.json().get("models", [])}
+    except (httpx.HTTPError, ValueError):
+        return
+    for m, st in model_state.items(): st["loaded"] = (m if ":" in m else m + ":latest") in resident
+
+async def _warm_loop():
+    while True:
+        for m in COACH_MODELS: await warm(m)
+        await refresh_loaded()
+        await asyncio.sleep(COACH_WARM_INTERVAL)
+
+def start_warmer():
+    global _warmer
+    if COACH_WARM_INTERVAL > 0 and _warmer is None:
+        _warmer = asyncio.get_running_loop().create_task(_warm_loop())
+
+def sse(data: dict, event: Optional[str] = None) -> str:
+    return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+
+async def stream_chat(ticket: Ticket, messages: list, model: str = COACH_MODELS[-1],
+                      on_complete: Optional[Callable[[str, dict], Awaitable]] = None) -> AsyncIterator[str]:
+    """Yield SSE frames for one chat completion once `ticket` (from scheduler.admit) gets its slot.
+
+    `on_complete(text, stats)` runs once the full reply is in, before the done event.
+    """
+    try:
+        yield ": queued\n\n"  # flushes headers so the client knows it is waiting, not stalled
+        async with ticket:
+            t0 = time.perf_counter(); ttft = None; parts = []
+            try:
+                async with client().stream("POST", "/api/chat", json={"model": model, "messages": messages, "stream": True,
+                                                                      "keep_alive": COACH_KEEP_ALIVE}) as r:
+                    if r.status_code != 200:
+                        await r.aread()
+                        yield sse({"detail": f"model host returned {r.status_code}: {r.text[:200]}"}, "error")
+                        return
+                    async for line in r.aiter_lines():
+                        if not line: continue
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            yield sse({"detail": chunk["error"]}, "error"); return
+                        delta = (chunk.get("message") or {}).get("content", "")
+                        if delta:
+                            if ttft is None: ttft = time.perf_counter() - t0
+                            parts.append(delta)
+                            yield sse({"delta": delta})
+                        if chunk.get("done"):
+                            # prompt_eval_count only counts tokens not served from the host's prompt cache
+                            stats = {"model": model, "ttft_ms": round((ttft or 0) * 1000),
+                                     "prompt_eval_count": chunk.get("prompt_eval_count"),
+                                     "prompt_eval_ms": round((chunk.get("prompt_eval_duration") or 0) / 1e6),
+                                     "eval_count": chunk.get("eval_count"), "total_ms": round((time.perf_counter() - t0) * 1000)}
+                            if on_complete: stats.update(await on_complete("".join(parts), stats) or {})
+                            yield sse(stats, "done")
+                            return
+            except httpx.HTTPError as e:
+                yield sse({"detail": f"model host unavailable: {type(e).__name__}"}, "error")
+    finally:
+        ticket.release()
+
+async def stream_cached(text: str, on_complete: Optional[Callable[[str, dict], Awaitable]] = None,
+                        words_per_chunk: int = 8) -> AsyncIterator[str]:
+    """Replay a cached reply through the same frames as stream_chat, without touching the model host."""
+    words = text.split(" ")
+    for i in range(0, len(words), words_per_chunk):
+        yield sse({"delta": " ".join(words[i:i + words_per_chunk]) + (" " if i + words_per_chunk < len(words) else "")})
+    stats = {"model": None, "cached": True, "ttft_ms": 0, "prompt_eval_count": 0, "eval_count": 0, "total_ms": 0}
+    if on_complete: stats.update(await on_complete(text, stats) or {})
+    yield sse(stats, "done")
@@ -0,0 +1,91 @@
+"""Answer cache for standalone coach questions.
+
+Teens ask the same few questions ("healthy snack ideas", "how much water").
+Opening questions of new conversations are therefore cached. The key is the
+normalized question text plus BMI band and activity level, so differently
+worded copies of a question share an entry. An answer that may be cached is
+generated from those two facts only (conversation.bucket_facts), never from
+the asker's name, age, exact BMI or calorie goal, so a reply served to
+another teen can't carry someone else's details. Entries live in a TTLCache
+(TTL + LRU).
+
+If COACH_CACHE_EMBED_MODEL names an Ollama embedding model, a question with no
+exact match is also compared to cached questions from the same profile bucket.
+The closest one is used when its cosine similarity reaches
+COACH_CACHE_SIMILARITY.
+"""
+import os, re, numpy as np
+from collections import defaultdict, deque
+from typing import Optional, Tuple
+import httpx
+
+from .cache import TTLCache
+from . import coach
+
+COACH_CACHE_TTL = float(os.getenv("COACH_CACHE_TTL", str(24 * 60 * 60)))
+COACH_CACHE_SIZE = int(os.getenv("COACH_CACHE_SIZE", "2000"))
+COACH_CACHE_EMBED_MODEL = os.getenv("COACH_CACHE_EMBED_MODEL", "")  # empty = exact matches only
+COACH_CACHE_SIMILARITY = float(os.getenv("COACH_CACHE_SIMILARITY", "0.92"))
+
+_POLITE = re.compile(r"\b(please|pls|plz|thanks|thank you|hi|hey|hello)\b")
+
+def normalize(question: str) -> str:
+    t = re.sub(r"[^a-z0-9\s]", " ", question.lower())
+    return " ".join(_POLITE.sub(" ", t).split())
+
+class ResponseCache:
+    def __init__(self, maxsize: int, ttl: float, embed_model: str = "", threshold: float = 0.92):
+        self.answers = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.enabled = ttl > 0 and maxsize > 0
+        self.embed_model, self.threshold = embed_model, threshold
+        # per (band, activity): recent (key, unit vector) pairs; stale keys simply miss in `answers`
+        self._vectors = defaultdict(lambda: deque(maxlen=maxsize))
+        self.hits = self.semantic_hits = self.misses = self.bypassed = 0
+
+    def key(self, question: str, band: str, activity: Optional[str]) -> tuple:
+        return (band, activity or "", normalize(question))
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            r = await coach.client().post("/api/embed", json={"model": self.embed_model, "input": text}, timeout=5.0)
+            r.raise_for_status()
+            v = np.asarray(r.json()["embeddings"][0], dtype=np.float32)
+        except (httpx.HTTPError, KeyError, IndexError, ValueError):
+            return None  # no embedding model available: behave as an exact-match cache
+        n = float(np.linalg.norm(v))
+        return v / n if n else None
+
+    async def lookup(self, key: tuple) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return (cached answer or None, question embedding to pass back to store())."""
+        text = self.answers.get(key)
+        if text is not None:
+            self.hits += 1
+            return text, None
+        vec = None
+        if self.embed_model and key[2]:
+            vec = await self._embed(key[2])
+            bucket = self._vectors.get(key[:2])
+            if vec is not None and bucket:
+                keys, mat = zip(*bucket)
+                sims = np.stack(mat) @ vec
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    text = self.answers.get(keys[best])
+                    if text is not None:
+                        self.semantic_hits += 1
+                        return text, None
+        self.misses += 1
+        return None, vec
+
+    def store(self, key: tuple, text: str, vec: Optional[np.ndarray] = None):
+        if not text: return
+        self.answers.set(key, text)
+        if vec is not None: self._vectors[key[:2]].append((key, vec))
+
+    def stats(self) -> dict:
+        total = self.hits + self.semantic_hits + self.misses
+        return {"enabled": self.enabled, "size": self.answers.stats()["size"], "hits": self.hits,
+                "semantic_hits": self.semantic_hits, "misses": self.misses, "bypassed": self.bypassed,
+                "hit_rate": round((self.hits + self.semantic_hits) / total, 4) if total else 0.0}
+
+cache = ResponseCache(COACH_CACHE_SIZE, COACH_CACHE_TTL, COACH_CACHE_EMBED_MODEL, COACH_CACHE_SIMILARITY)
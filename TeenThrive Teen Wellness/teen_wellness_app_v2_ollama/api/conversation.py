@@ -0,0 +1,92 @@
+"""Prompt assembly for coach chat under a fixed token budget.
+
+The model sees one system message, holding the coach instructions, the teen's
+profile facts and a digest of older turns, followed by the recent messages
+verbatim. The digest is extractive: it keeps the leading sentence of each
+earlier question, newest first, until COACH_DIGEST_TOKENS is used. No model
+call is needed to build it. Prompt size therefore stays roughly constant
+however long the chat runs.
+
+Assembly is deterministic in the stored transcript, and the split between
+digest and window only moves every COACH_DIGEST_BLOCK messages. Between those
+boundaries each prompt extends the previous one, so the model host can reuse
+its KV cache for the shared prefix instead of re-evaluating it. The same holds
+when a conversation is resumed later.
+
+Token counts are estimated as characters / 4, which is close enough for
+English text and avoids shipping a tokenizer for every model.
+"""
+import os, re
+from typing import List, Optional
+
+COACH_HISTORY_MESSAGES = int(os.getenv("COACH_HISTORY_MESSAGES", "6"))
+COACH_DIGEST_BLOCK = int(os.getenv("COACH_DIGEST_BLOCK", "6"))
+COACH_PROMPT_TOKENS = int(os.getenv("COACH_PROMPT_TOKENS", "2048"))
+COACH_DIGEST_TOKENS = int(os.getenv("COACH_DIGEST_TOKENS", "200"))
+
+INSTRUCTIONS = ("You are a friendly health coach for teenagers. Give short answers as 3 points about diet, "
+                "fitness or motivation. Be encouraging, avoid medical diagnoses and suggest a trusted adult "
+                "or doctor for medical concerns.")
+DIGEST_HEADER = "Earlier in this chat the teen asked about:\n"
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def _clip(text: str, tokens: int) -> str:
+    return text if estimate_tokens(text) <= tokens else text[:max(0, tokens * 4 - 2)].rstrip() + "…"
+
+def profile_facts(name: Optional[str], age: Optional[int], gender: Optional[str], bmi: Optional[float],
+                  band: str, activity: Optional[str], kcal_goal: Optional[int]) -> List[str]:
+    facts = []
+    if name: facts.append(f"Name: {name}")
+    if age: facts.append(f"Age: {age}")
+    if gender: facts.append(f"Gender: {gender}")
+    if bmi is not None: facts.append(f"BMI: {bmi:.1f} ({band})")
+    if activity: facts.append(f"Activity level: {activity}")
+    if kcal_goal: facts.append(f"Daily calorie goal: {kcal_goal} kcal")
+    return facts
+
+def bucket_facts(band: str, activity: Optional[str]) -> List[str]:
+    """Only what an answer cache entry is keyed on, for prompts whose reply may be shown to other teens."""
+    facts = [] if band == "unknown" else [f"BMI range: {band}"]
+    if activity: facts.append(f"Activity level: {activity}")
+    return facts
+
+def digest(older: List[dict], budget: int = COACH_DIGEST_TOKENS) -> str:
+    """Leading sentence of each earlier user question, newest first, within `budget` tokens."""
+    lines, used = [], 0
+    for m in reversed(older):
+        if m["role"] != "user": continue
+        first = re.split(r"(?<=[.!?])\s", m["content"].strip(), maxsplit=1)[0]
+        line = "- " + _clip(first, 40)
+        cost = estimate_tokens(line)
+        if used + cost > budget: break
+        lines.append(line); used += cost
+    return "\n".join(reversed(lines))
+
+def system_prompt(facts: List[str], summary: str = "") -> str:
+    parts = [INSTRUCTIONS]
+    if facts: parts.append("About the teen:\n" + "\n".join(f"- {f}" for f in facts))
+    if summary: parts.append(DIGEST_HEADER + summary)
+    return "\n\n".join(parts)
+
+def build(messages: List[dict], facts: List[str], history: int = COACH_HISTORY_MESSAGES,
+          budget: int = COACH_PROMPT_TOKENS, block: int = COACH_DIGEST_BLOCK) -> List[dict]:
+    """Model messages for `messages` (oldest first, ending with the user's turn)."""
+    # the window keeps at least `history` messages and its start only advances a whole block at a time
+    cut = max(0, len(messages) - history)
+    recent = messages[cut - cut % max(1, block):]
+    # a reply without its question is noise; start the window on a user turn
+    while len(recent) > 1 and recent[0]["role"] != "user": recent = recent[1:]
+    # the digest's share is reserved up front; whatever the window drops is summarized into it
+    left = budget - estimate_tokens(system_prompt(facts)) - estimate_tokens("\n\n" + DIGEST_HEADER) - COACH_DIGEST_TOKENS
+    kept = []
+    for m in reversed(recent):
+        cost = estimate_tokens(m["content"])
+        if cost > left:
+            if not kept:  # the current question alone is over budget: keep its head
+                kept.append({"role": m["role"], "content": _clip(m["content"], max(left, 1))})
+            break
+        kept.append({"role": m["role"], "content": m["content"]}); left -= cost
+    older = messages[:len(messages) - len(kept)]
+    return [{"role": "system", "content": system_prompt(facts, digest(older))}] + kept[::-1]
@@ -0,0 +1,45 @@
+"""Database engine configuration.
+
+DATABASE_URL selects the backend (default: the local SQLite file). For SQLite
+every new connection runs the pragmas below: WAL lets readers proceed while
+one writer commits, synchronous=NORMAL is durable under WAL except on power
+loss, and busy_timeout makes writers wait for the lock instead of failing with
+"database is locked". Other backends only get the pool settings.
+"""
+import os
+from sqlalchemy import event
+from sqlmodel import create_engine
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./calorie_tracker.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", str(-64 * 1024))),  # negative = KiB, i.e. 64 MiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+def _engine():
+    if not IS_SQLITE:
+        return create_engine(DATABASE_URL, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+                             pool_timeout=POOL_TIMEOUT, pool_pre_ping=True)
+    # timeout is sqlite3's own lock wait, kept in line with busy_timeout
+    eng = create_engine(DATABASE_URL, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT,
+                        connect_args={"check_same_thread": False, "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000})
+
+    @event.listens_for(eng, "connect")
+    def _set_pragmas(dbapi_conn, _):
+        cur = dbapi_conn.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cur.execute(f"PRAGMA {name}={value}")
+        cur.close()
+    return eng
+
+engine = _engine()
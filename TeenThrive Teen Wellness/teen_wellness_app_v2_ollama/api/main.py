@@ -1,39 +1,36 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Query, Depends
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Query, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlmodel import SQLModel, Session, create_engine, select
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlmodel import Session, select
+from sqlalchemy import func, or_, and_, update, delete
+from sqlalchemy.exc import IntegrityError
 from typing import Optional, List
 from datetime import datetime, date, timedelta, timezone
-from PIL import Image
-import io, os, json, numpy as np, certifi
+from starlette.concurrency import run_in_threadpool
+import asyncio, base64, logging, os, time, weakref, numpy as np, certifi
 
 os.environ.setdefault("SSL_CERT_FILE", certifi.where())
 
-from .models import User, FoodItem, MoodLog, JournalEntry, TodoItem, BadgeEarned, ActivityLog
+from .models import User, FoodItem, MoodLog, JournalEntry, TodoItem, BadgeEarned, ActivityLog, DailyRollup, RefreshToken, ChatConversation, ChatMessage
 from .schemas import *
 from .auth import *
-from .matcher import compute_features, match_confidence
+from .matcher import extract_features, hash_to_int64, hist_to_blob, blob_to_hist
+from .match_index import indexes, catalog, sync
+from .workers import feature_pool, password_pool, login_limiter, client_ip
+from .cache import TTLCache
+from .db import engine
+from . import storage, thumbs, rollup, migrations, coach, conversation
+from .coach_cache import cache as answer_cache
 
-DB_URL = "sqlite:///./calorie_tracker.db"
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
 BASE_DIR = os.path.dirname(__file__)
-STORAGE_DIR = os.path.join(BASE_DIR, "..", "storage")
+STORAGE_DIR = os.getenv("STORAGE_DIR", os.path.join(BASE_DIR, "..", "storage"))
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
+log = logging.getLogger(__name__)
+
 def init_db():
-    SQLModel.metadata.create_all(engine)
-    try:
-        conn = engine.raw_connection(); cur = conn.cursor()
-        cur.execute("PRAGMA table_info(user)")
-        cols = [r[1] for r in cur.fetchall()]
-        for name, typ in [("name","TEXT"),("gender","TEXT"),("age_years","INTEGER"),
-                          ("height_cm","REAL"),("weight_kg","REAL"),
-                          ("activity_level","TEXT"),("kcal_goal","INTEGER")]:
-            if name not in cols:
-                cur.execute(f"ALTER TABLE user ADD COLUMN {name} {typ}")
-        conn.commit(); cur.close(); conn.close()
-    except Exception:
-        pass
+    migrations.upgrade(engine, log=log.info)
 
 app = FastAPI(title="Teen Calorie Tracker — US11p (reco + badges + chat)")
 app.add_middleware(
@@ -41,45 +38,171 @@ app.add_middleware(
     allow_origins=["*"], allow_credentials=True,
     allow_methods=["*"], allow_headers=["*"],
 )
+
+# Registered before the /static mount so it takes precedence over StaticFiles
+@app.get("/static/thumbs/{size}/{key:path}")
+def thumbnail(size: int, key: str, if_none_match: Optional[str] = Header(None)):
+    key = key[:-len(".webp")] if key.endswith(".webp") else ""
+    if size not in thumbs.SIZES or not thumbs.valid_key(key):
+        raise HTTPException(404, "Not found")
+    etag = f'"{size}-{os.path.basename(key)}"'
+    cache = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=cache)
+    try:
+        fpath = thumbs.ensure(os.path.abspath(STORAGE_DIR), key, size)
+    except OSError:  # missing original or undecodable image
+        raise HTTPException(404, "Not found")
+    return FileResponse(fpath, media_type="image/webp", headers=cache)
+
 app.mount("/static", StaticFiles(directory=os.path.abspath(STORAGE_DIR)), name="static")
 
 @app.on_event("startup")
-def startup(): init_db()
+def startup():
+    init_db()
+    with Session(engine) as s:
+        _purge_refresh_tokens(s)
+        # only access tokens issued before a revocation need refusing, and those expire within ACCESS_TOKEN_TTL
+        since = datetime.utcnow() - timedelta(seconds=ACCESS_TOKEN_TTL)
+        for fam, at in s.exec(select(RefreshToken.family, func.max(RefreshToken.revoked_at))
+                              .where(RefreshToken.revoked_at > since, RefreshToken.family_revoked == True)
+                              .group_by(RefreshToken.family)).all():
+            revoked_families[fam] = at.replace(tzinfo=timezone.utc).timestamp()
+
+@app.on_event("startup")
+async def start_coach_warmer(): coach.start_warmer()
+
+@app.on_event("shutdown")
+async def shutdown():
+    feature_pool.shutdown(); password_pool.shutdown()
+    await coach.aclose()
 
 def get_session():
     with Session(engine) as s:
         yield s
 
+# Decoded tokens and user rows are cached per process so the auth hot path does no DB query.
+# Cached users are detached copies; update_profile evicts the user's entry.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+token_cache = TTLCache(maxsize=int(os.getenv("AUTH_CACHE_SIZE", "10000")), ttl=AUTH_CACHE_TTL)
+user_cache = TTLCache(maxsize=int(os.getenv("AUTH_CACHE_SIZE", "10000")), ttl=AUTH_CACHE_TTL)
+# refresh-token families that were logged out or caught reusing a rotated token, with the revocation time;
+# access tokens carrying one of these "fam" claims are refused until they expire
+revoked_families: dict = {}
+
 def get_user(authorization: Optional[str] = Header(None), session: Session = Depends(get_session)) -> User:
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(401, "Missing token")
     parts = authorization.split()
     token = parts[1] if len(parts) > 1 else None
-    payload = decode_token(token) if token else None
-    if not payload: raise HTTPException(401, "Invalid token")
-    u = session.exec(select(User).where(User.email == payload["sub"])).first()
-    if not u: raise HTTPException(401, "User not found")
+    payload = token_cache.get(token) if token else None
+    if payload is None:
+        payload = decode_token(token) if token else None
+        if not payload: raise HTTPException(401, "Invalid token")
+        token_cache.set(token, payload, ttl=payload["exp"] - time.time())
+    if payload.get("fam") in revoked_families: raise HTTPException(401, "Session revoked")
+    uid = payload.get("uid")
+    u = user_cache.get(uid) if uid is not None else None
+    if u is None:
+        # tokens issued before "uid" was added still resolve by email
+        u = session.get(User, uid) if uid is not None else session.exec(select(User).where(User.email == payload["sub"])).first()
+        if not u: raise HTTPException(401, "User not found")
+        u = User(**u.model_dump())
+        user_cache.set(u.id, u)
     return u
 
 @app.get("/health")
 def health():
-    return {"status":"ok","message":"US11p build"}
+    return {"status":"ok","message":"US11p build","feature_pool":feature_pool.stats(),"password_pool":password_pool.stats(),
+            "auth_cache":{"tokens":token_cache.stats(),"users":user_cache.stats()},"coach":coach.scheduler.stats(),"coach_models":coach.model_state,
+            "coach_cache":answer_cache.stats(),"match_indexes":indexes.stats()}
 
 # Auth
+def _find_user(session: Session, email: str) -> Optional[User]:
+    return session.exec(select(User).where(User.email == email)).first()
+
+def _store(session: Session, obj):
+    session.add(obj); session.commit(); session.refresh(obj)
+    return obj
+
+def _issue_tokens(session: Session, u: User, family: Optional[str] = None) -> TokenResponse:
+    family = family or new_token_family()
+    refresh = new_refresh_token()
+    session.add(RefreshToken(user_id=u.id, token_hash=hash_refresh_token(refresh), family=family,
+                             expires_at=datetime.utcnow() + timedelta(seconds=REFRESH_TOKEN_TTL)))
+    session.commit()
+    return TokenResponse(access_token=create_token(u.email, u.id, fam=family), expires_in=ACCESS_TOKEN_TTL, refresh_token=refresh)
+
+def _revoke_family(session: Session, family: str):
+    now = datetime.utcnow()
+    for r in session.exec(select(RefreshToken).where(RefreshToken.family == family)).all():
+        r.family_revoked = True; r.revoked_at = r.revoked_at or now; session.add(r)
+    session.commit()
+    revoked_families[family] = time.time()
+
+REFRESH_PURGE_INTERVAL = float(os.getenv("REFRESH_PURGE_INTERVAL", "3600"))
+_last_purge = 0.0
+
+def _purge_refresh_tokens(session: Session):
+    """Delete expired refresh tokens, and rotated or revoked ones past REFRESH_REUSE_WINDOW; forget old revocations."""
+    global _last_purge
+    now = datetime.utcnow()
+    t = RefreshToken.__table__
+    session.execute(delete(t).where(or_(t.c.expires_at <= now,
+                                        t.c.revoked_at <= now - timedelta(seconds=REFRESH_REUSE_WINDOW))))
+    session.commit()
+    cutoff = time.time() - ACCESS_TOKEN_TTL
+    for fam in [f for f, at in revoked_families.items() if at < cutoff]: del revoked_families[fam]
+    _last_purge = time.monotonic()
+
+# bcrypt runs in the dedicated password pool; DB work stays in the regular threadpool
 @app.post("/auth/register", response_model=TokenResponse)
-def register(req: RegisterRequest, session: Session = Depends(get_session)):
-    if session.exec(select(User).where(User.email == req.email)).first():
+async def register(req: RegisterRequest, session: Session = Depends(get_session)):
+    if await run_in_threadpool(_find_user, session, req.email):
         raise HTTPException(400, "Email already registered")
-    u = User(email=req.email, password_hash=hash_password(req.password))
-    session.add(u); session.commit()
-    return TokenResponse(access_token=create_token(u.email))
+    u = User(email=req.email, password_hash=await password_pool.run(hash_password, req.password))
+    u = await run_in_threadpool(_store, session, u)
+    return await run_in_threadpool(_issue_tokens, session, u)
 
 @app.post("/auth/login", response_model=TokenResponse)
-def login(req: LoginRequest, session: Session = Depends(get_session)):
-    u = session.exec(select(User).where(User.email == req.email)).first()
-    if not u or not verify_password(req.password, u.password_hash):
-        raise HTTPException(401, "Invalid credentials")
-    return TokenResponse(access_token=create_token(u.email))
+async def login(req: LoginRequest, request: Request, session: Session = Depends(get_session)):
+    async with login_limiter.slot(client_ip(request.client.host if request.client else None, request.headers.get("x-forwarded-for"))):
+        u = await run_in_threadpool(_find_user, session, req.email)
+        if not u or not await password_pool.run(verify_password, req.password, u.password_hash):
+            raise HTTPException(401, "Invalid credentials")
+        if needs_rehash(u.password_hash):
+            # BCRYPT_ROUNDS changed since this hash was made
+            u.password_hash = await password_pool.run(hash_password, req.password)
+            u = await run_in_threadpool(_store, session, u)
+    return await run_in_threadpool(_issue_tokens, session, u)
+
+# Refresh tokens are single-use: each refresh rotates to a new token in the same family.
+# Presenting an already-rotated token means it leaked, so the whole family is revoked.
+@app.post("/auth/refresh", response_model=TokenResponse)
+def refresh_token(req: RefreshRequest, session: Session = Depends(get_session)):
+    r = session.exec(select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(req.refresh_token))).first()
+    if not r or r.family_revoked: raise HTTPException(401, "Invalid refresh token")
+    if r.revoked_at is not None:
+        _revoke_family(session, r.family)
+        raise HTTPException(401, "Refresh token reused; session revoked")
+    if r.expires_at <= datetime.utcnow(): raise HTTPException(401, "Refresh token expired")
+    u = session.get(User, r.user_id)
+    if not u: raise HTTPException(401, "User not found")
+    # conditional update so two concurrent refreshes with the same token cannot both rotate it
+    t = RefreshToken.__table__
+    claimed = session.execute(update(t).where(t.c.id == r.id, t.c.revoked_at == None).values(revoked_at=datetime.utcnow())).rowcount
+    if not claimed:
+        session.rollback(); _revoke_family(session, r.family)
+        raise HTTPException(401, "Refresh token reused; session revoked")
+    out = _issue_tokens(session, u, r.family)
+    if time.monotonic() - _last_purge > REFRESH_PURGE_INTERVAL: _purge_refresh_tokens(session)
+    return out
+
+@app.post("/auth/logout")
+def logout(req: RefreshRequest, session: Session = Depends(get_session)):
+    r = session.exec(select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(req.refresh_token))).first()
+    if r: _revoke_family(session, r.family)
+    return {"ok": True}
 
 # Profile
 @app.get("/profile", response_model=ProfileOut)
@@ -88,111 +211,285 @@ def get_profile(user: User = Depends(get_user), session: Session = Depends(get_s
     return ProfileOut(
         email=u.email, name=u.name, gender=u.gender, age_years=u.age_years,
         height_cm=u.height_cm, weight_kg=u.weight_kg, activity_level=u.activity_level,
-        kcal_goal=u.kcal_goal, created_at=u.created_at
+        kcal_goal=u.kcal_goal, share_foods=bool(u.share_foods), created_at=u.created_at
     )
 
 @app.put("/profile", response_model=ProfileOut)
 def update_profile(payload: ProfileUpdate, user: User = Depends(get_user), session: Session = Depends(get_session)):
     u = session.get(User, user.id)
-    for f in ("name","gender","age_years","height_cm","weight_kg","activity_level","kcal_goal"):
+    was_shared = bool(u.share_foods)
+    for f in ("name","gender","age_years","height_cm","weight_kg","activity_level","kcal_goal","share_foods"):
         v = getattr(payload, f)
         if v is not None:
             setattr(u, f, v)
     session.add(u); session.commit(); session.refresh(u)
+    user_cache.pop(u.id)
+    if bool(u.share_foods) != was_shared:
+        _toggle_catalog(session, u.id, bool(u.share_foods))
     return ProfileOut(
         email=u.email, name=u.name, gender=u.gender, age_years=u.age_years,
         height_cm=u.height_cm, weight_kg=u.weight_kg, activity_level=u.activity_level,
-        kcal_goal=u.kcal_goal, created_at=u.created_at
+        kcal_goal=u.kcal_goal, share_foods=bool(u.share_foods), created_at=u.created_at
     )
 
 # Helpers
-def _day_bounds_local(d: date, tz_offset_minutes: int) -> tuple[datetime, datetime]:
-    local_start = datetime(d.year, d.month, d.day, 0, 0, 0)
-    start_utc = (local_start - timedelta(minutes=tz_offset_minutes)).replace(tzinfo=timezone.utc)
-    end_utc = start_utc + timedelta(days=1)
-    return start_utc, end_utc
-
 def _local_day(tz_offset_minutes:int)->str:
     now_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
     return (now_utc + timedelta(minutes=tz_offset_minutes)).date().isoformat()
 
 # Items
+def _user_index(session: Session, user_id: int):
+    def load(after_id: int):
+        rows = session.exec(select(FoodItem).where(FoodItem.user_id == user_id, FoodItem.id > after_id).order_by(FoodItem.id)).all()
+        return map(_index_row, rows)
+    return indexes.get(user_id, load)
+
+def _index_row(it: FoodItem):
+    return it.id, it.calories, {"phash": it.phash, "ahash": it.ahash, "dhash": it.dhash}, blob_to_hist(it.hist)
+
+def _catalog_index(session: Session):
+    def load(after_id: int):
+        rows = session.exec(select(FoodItem).join(User, User.id == FoodItem.user_id)
+                            .where(User.share_foods == True, FoodItem.id > after_id).order_by(FoodItem.id)).all()
+        return map(_index_row, rows)
+    return sync(catalog, load)
+
+def _toggle_catalog(session: Session, user_id: int, shared: bool):
+    _catalog_index(session)
+    rows = session.exec(select(FoodItem).where(FoodItem.user_id == user_id)).all()
+    for it in rows:
+        if shared and it.calories is not None: catalog.add(*_index_row(it))
+        elif not shared: catalog.remove(it.id)
+
+def _live_matches(session: Session, idx, q_hash: dict, q_hist, k: int, shared: bool = False):
+    """`idx.matches` without rows deleted, or unshared, in another worker since this one indexed them.
+
+    Sync only appends new ids, so hits are checked against the database before
+    they are used; stale ids are evicted from `idx` and the search repeated.
+    """
+    while True:
+        hits = idx.matches(q_hash, q_hist, k=k)
+        if not hits: return hits
+        q = select(FoodItem.id).where(FoodItem.id.in_([h[0] for h in hits]))
+        if shared: q = q.join(User, User.id == FoodItem.user_id).where(User.share_foods == True)
+        live = set(session.exec(q).all())
+        if len(live) == len(hits): return hits
+        for h in hits:
+            if h[0] not in live: idx.remove(h[0])
+
+CATALOG_NEIGHBORS = 7
+
+def _catalog_predict(session: Session, q_hash: dict, q_hist) -> Optional[PredictOut]:
+    hits = _live_matches(session, _catalog_index(session), q_hash, q_hist, CATALOG_NEIGHBORS, shared=True)
+    if not hits: return None
+    kcals = np.array([h[1] for h in hits], dtype=float)
+    q25, q50, q75 = np.percentile(kcals, [25, 50, 75])
+    conf = float(np.mean([h[2] for h in hits]))
+    return PredictOut(matched=True, predicted_calories=int(round(q50)), confidence=float(round(conf,3)),
+                      calorie_spread=int(round(q75 - q25)), neighbors=len(hits), source="catalog",
+                      hint=f"Estimated from {len(hits)} similar photo(s) shared by other users")
+
+def _new_item(session: Session, user: User, content: bytes, calories: int, day: str, q_hash: dict, q_hist) -> FoodItem:
+    rec = FoodItem(user_id=user.id, path=storage.put(STORAGE_DIR, content), calories=int(calories), day=day,
+                   phash=hash_to_int64(q_hash["phash"]), ahash=hash_to_int64(q_hash["ahash"]),
+                   dhash=hash_to_int64(q_hash["dhash"]), hist=hist_to_blob(q_hist))
+    session.add(rec)
+    rollup.bump(session, user.id, day, calories=rec.calories, items_count=1)
+    return rec
+
+def _index_saved(user: User, rec: FoodItem, q_hash: dict, q_hist):
+    idx = indexes.peek(user.id)
+    if idx is not None: idx.add(rec.id, rec.calories, q_hash, q_hist)
+    if user.share_foods: catalog.add(rec.id, rec.calories, q_hash, q_hist)
+
+def _save_item(session: Session, user: User, content: bytes, calories: int, day: str, q_hash: dict, q_hist) -> FoodItem:
+    rec = _new_item(session, user, content, calories, day, q_hash, q_hist)
+    session.commit(); session.refresh(rec)
+    storage.put(STORAGE_DIR, content)  # re-create if a concurrent delete dropped the last reference meanwhile
+    _index_saved(user, rec, q_hash, q_hist)
+    return rec
+
+def _predict(session: Session, user: User, q_hash: dict, q_hist, idx=None) -> PredictOut:
+    hits = _live_matches(session, idx if idx is not None else _user_index(session, user.id), q_hash, q_hist, 1)
+    if hits:
+        item_id, kcal, conf, _ = hits[0]
+        return PredictOut(matched=True, predicted_calories=kcal, confidence=float(round(conf,3)), match_item_id=item_id, neighbors=1, hint="Matched similar photo")
+    if user.share_foods:
+        pred = _catalog_predict(session, q_hash, q_hist)
+        if pred is not None: return pred
+    return PredictOut(matched=False, hint="No close match yet. Enter calories once.")
+
+async def _features(content: bytes):
+    # decode + hashing runs in the bounded pool; a full pool answers 503 + Retry-After
+    try:
+        return await feature_pool.run(extract_features, content)
+    except ValueError:
+        raise HTTPException(400, "Invalid image")
+
 @app.post("/items", response_model=PredictOut)
 async def create_or_predict(file: UploadFile = File(...), calories: Optional[int] = Form(default=None),
+                            tz_offset_minutes: int = Form(default=0),
                             user: User = Depends(get_user), session: Session = Depends(get_session)):
     content = await file.read()
-    try:
-        img = Image.open(io.BytesIO(content))
-    except Exception:
-        raise HTTPException(400, "Invalid image")
-    q_hash, q_hist = compute_features(img)
-
+    q_hash, q_hist = await _features(content)
     if calories is not None:
-        filename = f"{int(datetime.utcnow().timestamp()*1000)}_upload.jpg"
-        fpath = os.path.join(STORAGE_DIR, filename)
-        with open(fpath, "wb") as out: out.write(content)
-        rec = FoodItem(user_id=user.id, path=fpath, calories=int(calories),
-                       phash=q_hash["phash"], ahash=q_hash["ahash"], dhash=q_hash["dhash"],
-                       hist_json=json.dumps(q_hist.tolist()))
-        session.add(rec); session.commit(); session.refresh(rec)
+        rec = await run_in_threadpool(_save_item, session, user, content, calories, _local_day(tz_offset_minutes), q_hash, q_hist)
         return PredictOut(matched=False, saved_item_id=rec.id, hint="Saved with entered calories.")
-
-    items = session.exec(select(FoodItem).where(FoodItem.user_id == user.id).order_by(FoodItem.id.desc()).limit(1000)).all()
-    best, best_conf, best_hd = None, 0.0, 999
-    for it in items:
-        if it.calories is None: continue
-        db_hash = {"phash": it.phash, "ahash": it.ahash, "dhash": it.dhash}
-        db_hist = np.array(json.loads(it.hist_json), dtype=float)
-        ok, conf, hd, cs = match_confidence(q_hash, q_hist, db_hash, db_hist)
-        if ok and (conf > best_conf or (conf == best_conf and hd < best_hd)):
-            best, best_conf, best_hd = it, conf, hd
-    if best is not None:
-        return PredictOut(matched=True, predicted_calories=best.calories, confidence=float(round(best_conf,3)), match_item_id=best.id, hint="Matched similar photo")
-    return PredictOut(matched=False, hint="No close match yet. Enter calories once.")
-
-@app.get("/items", response_model=List[ItemRow])
-def list_items(user: User = Depends(get_user), session: Session = Depends(get_session)):
-    rows = session.exec(select(FoodItem).where(FoodItem.user_id == user.id).order_by(FoodItem.created_at.desc())).all()
-    return [ItemRow(id=r.id, calories=r.calories, created_at=r.created_at, image_url=f"/static/{os.path.basename(r.path)}") for r in rows]
+    return await run_in_threadpool(_predict, session, user, q_hash, q_hist)
+
+MAX_BATCH = int(os.getenv("MAX_BATCH_UPLOAD", "50"))
+
+def _save_and_predict_batch(session: Session, user: User, contents: list, kcals: list, feats: list, day: str) -> List[PredictOut]:
+    out: List[Optional[PredictOut]] = [None] * len(contents)
+    new = []
+    for i, (content, kcal, f) in enumerate(zip(contents, kcals, feats)):
+        if f is None:
+            out[i] = PredictOut(matched=False, hint="Invalid image")
+        elif kcal is not None:
+            new.append((i, _new_item(session, user, content, kcal, day, *f), f))
+    if new:
+        # all labeled photos (and their rollup bumps) land in one transaction
+        session.commit()
+        for i, _, _ in new: storage.put(STORAGE_DIR, contents[i])
+        for i, rec, f in new:
+            session.refresh(rec)
+            _index_saved(user, rec, *f)
+            out[i] = PredictOut(matched=False, saved_item_id=rec.id, hint="Saved with entered calories.")
+    idx = _user_index(session, user.id)
+    for i, f in enumerate(feats):
+        if out[i] is None: out[i] = _predict(session, user, *f, idx=idx)
+    return out
+
+@app.post("/items/batch", response_model=List[PredictOut])
+async def create_or_predict_batch(files: List[UploadFile] = File(...), calories: List[str] = Form(default=[]),
+                                  tz_offset_minutes: int = Form(default=0), user: User = Depends(get_user), session: Session = Depends(get_session)):
+    """Log or predict many photos at once; `calories[i]` labels `files[i]` (blank = predict only)."""
+    if len(files) > MAX_BATCH: raise HTTPException(413, f"At most {MAX_BATCH} images per batch")
+    if len(calories) > len(files): raise HTTPException(400, "More calorie values than images")
+    try:
+        kcals = [int(c) if str(c).strip() else None for c in calories] + [None] * (len(files) - len(calories))
+    except ValueError:
+        raise HTTPException(400, "Calories must be integers")
+    contents = [await f.read() for f in files]
+    # keep at most `workers` of this batch in the pool so one backfill can't fill the queue alone
+    gate = asyncio.Semaphore(feature_pool.workers)
+    async def one(content: bytes):
+        async with gate:
+            try:
+                return await feature_pool.run(extract_features, content)
+            except ValueError:
+                return None
+    feats = await asyncio.gather(*(one(c) for c in contents))
+    return await run_in_threadpool(_save_and_predict_batch, session, user, contents, kcals, feats, _local_day(tz_offset_minutes))
+
+def _encode_cursor(r: FoodItem) -> str:
+    return base64.urlsafe_b64encode(f"{r.created_at.isoformat()}|{r.id}".encode()).decode()
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        ts, item_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(item_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+@app.get("/items", response_model=ItemPage)
+def list_items(limit: int = Query(default=50, ge=1, le=200), cursor: Optional[str] = Query(default=None),
+               user: User = Depends(get_user), session: Session = Depends(get_session)):
+    # keyset pagination on (created_at, id), served by ix_fooditem_user_created_id
+    q = select(FoodItem).where(FoodItem.user_id == user.id)
+    if cursor:
+        c_ts, c_id = _decode_cursor(cursor)
+        q = q.where(or_(FoodItem.created_at < c_ts, and_(FoodItem.created_at == c_ts, FoodItem.id < c_id)))
+    rows = session.exec(q.order_by(FoodItem.created_at.desc(), FoodItem.id.desc()).limit(limit + 1)).all()
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return ItemPage(items=[_item_row(r) for r in rows[:limit]], next_cursor=next_cursor)
+
+def _item_row(r: FoodItem) -> ItemRow:
+    return ItemRow(id=r.id, calories=r.calories, created_at=r.created_at, image_url=f"/static/{storage.url_path(r.path)}",
+                   thumb_url=thumbs.url_for(r.path, 160), thumb_large_url=thumbs.url_for(r.path, 480))
 
 @app.delete("/items/{item_id}")
 def delete_item(item_id: int, user: User = Depends(get_user), session: Session = Depends(get_session)):
     it = session.get(FoodItem, item_id)
     if not it or it.user_id != user.id: raise HTTPException(404, "Not found")
-    try:
-        if it.path and os.path.exists(it.path): os.remove(it.path)
-    except Exception: pass
+    path = it.path
+    rollup.bump(session, user.id, it.day or it.created_at.date().isoformat(), calories=-(it.calories or 0), items_count=-1)
     session.delete(it); session.commit()
+    # files are shared by identical uploads; unlink only with the last reference
+    in_use = lambda: session.exec(select(func.count()).select_from(FoodItem).where(FoodItem.path == path)).one() > 0
+    if path and not in_use() and storage.release(STORAGE_DIR, path, in_use):
+        thumbs.unlink(STORAGE_DIR, path)
+    idx = indexes.peek(user.id)
+    if idx is not None: idx.remove(item_id)
+    catalog.remove(item_id)
     return {"ok": True}
 
 # Summaries
+SUMMARY_BUCKETS = ("day", "week", "month")
+MAX_SUMMARY_DAYS = 3 * 366
+
+def _bucket_start(d: date, bucket: str) -> date:
+    if bucket == "week": return d - timedelta(days=d.weekday())
+    if bucket == "month": return d.replace(day=1)
+    return d
+
+def _next_bucket(d: date, bucket: str) -> date:
+    if bucket == "week": return d + timedelta(days=7)
+    if bucket == "month": return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return d + timedelta(days=1)
+
+def _calorie_buckets(session: Session, user_id: int, start_d: date, end_d: date, bucket: str = "day") -> List[DailySummary]:
+    """Calorie totals/counts per local day, week (Mon-start) or month from DailyRollup, zero-filled."""
+    rows = session.exec(select(DailyRollup.day, DailyRollup.calories, DailyRollup.items_count)
+                        .where(DailyRollup.user_id == user_id, DailyRollup.day >= start_d.isoformat(),
+                               DailyRollup.day <= end_d.isoformat())).all()
+    got = {}
+    for day, total, count in rows:
+        k = _bucket_start(date.fromisoformat(day), bucket)
+        t, n = got.get(k, (0, 0))
+        got[k] = (t + int(total), n + int(count))
+    out, d = [], _bucket_start(start_d, bucket)
+    while d <= end_d:
+        total, count = got.get(d, (0, 0))
+        out.append(DailySummary(date=d, total_calories=total, items_count=count))
+        d = _next_bucket(d, bucket)
+    return out
+
 @app.get("/summary/daily", response_model=DailySummary)
 def daily_summary(date_str: Optional[str] = Query(default=None, alias="date"),
                   tz_offset_minutes: int = Query(default=0, ge=-24*60, le=24*60),
                   user: User = Depends(get_user), session: Session = Depends(get_session)):
-    d = date.fromisoformat(date_str) if date_str else datetime.utcnow().date()
-    s_utc, e_utc = _day_bounds_local(d, tz_offset_minutes)
-    rows = session.exec(select(FoodItem).where(FoodItem.user_id==user.id, FoodItem.created_at>=s_utc, FoodItem.created_at<e_utc)).all()
-    total = sum(int(r.calories or 0) for r in rows)
-    return DailySummary(date=d, total_calories=total, items_count=len(rows))
+    d = date.fromisoformat(date_str) if date_str else date.fromisoformat(_local_day(tz_offset_minutes))
+    r = session.get(DailyRollup, (user.id, d.isoformat()))
+    return DailySummary(date=d, total_calories=r.calories if r else 0, items_count=r.items_count if r else 0)
 
 @app.get("/summary/weekly", response_model=WeeklySummary)
 def weekly_summary(end_str: Optional[str] = Query(default=None, alias="end"),
                    tz_offset_minutes: int = Query(default=0, ge=-24*60, le=24*60),
                    user: User = Depends(get_user), session: Session = Depends(get_session)):
-    end_d = date.fromisoformat(end_str) if end_str else datetime.utcnow().date()
+    end_d = date.fromisoformat(end_str) if end_str else date.fromisoformat(_local_day(tz_offset_minutes))
     start_d = end_d - timedelta(days=6)
-    days_list, grand_total = [], 0
-    for i in range(7):
-        d = start_d + timedelta(days=i)
-        s_utc, e_utc = _day_bounds_local(d, tz_offset_minutes)
-        rows = session.exec(select(FoodItem).where(FoodItem.user_id==user.id, FoodItem.created_at>=s_utc, FoodItem.created_at<e_utc)).all()
-        total = sum(int(r.calories or 0) for r in rows)
-        grand_total += total
-        days_list.append(DailySummary(date=d, total_calories=total, items_count=len(rows)))
+    days_list = _calorie_buckets(session, user.id, start_d, end_d)
+    grand_total = sum(d.total_calories for d in days_list)
     avg = grand_total / 7.0
     return WeeklySummary(start=start_d, end=end_d, total_calories=grand_total, avg_per_day=avg, days=days_list)
 
+@app.get("/summary/range", response_model=RangeSummary)
+def range_summary(start_str: Optional[str] = Query(default=None, alias="start"),
+                  end_str: Optional[str] = Query(default=None, alias="end"),
+                  bucket: str = Query(default="day"),
+                  tz_offset_minutes: int = Query(default=0, ge=-24*60, le=24*60),
+                  user: User = Depends(get_user), session: Session = Depends(get_session)):
+    if bucket not in SUMMARY_BUCKETS: raise HTTPException(400, "bucket must be day, week or month")
+    end_d = date.fromisoformat(end_str) if end_str else date.fromisoformat(_local_day(tz_offset_minutes))
+    start_d = date.fromisoformat(start_str) if start_str else end_d - timedelta(days=29)
+    if start_d > end_d: raise HTTPException(400, "start must not be after end")
+    if (end_d - start_d).days >= MAX_SUMMARY_DAYS: raise HTTPException(400, f"Range is limited to {MAX_SUMMARY_DAYS} days")
+    buckets = _calorie_buckets(session, user.id, start_d, end_d, bucket)
+    return RangeSummary(start=start_d, end=end_d, bucket=bucket,
+                        total_calories=sum(b.total_calories for b in buckets),
+                        items_count=sum(b.items_count for b in buckets), buckets=buckets)
+
 # Mood
 MOODS = {"happy":"😄","sad":"😢","angry":"😠","frustrated":"😣","scared":"😱"}
 
@@ -211,10 +508,19 @@ def mood_set(req: MoodSetRequest, user: User = Depends(get_user), session: Sessi
     day, slot = _local_day_and_slot(now_utc, req.tz_offset_minutes)
     existing = session.exec(select(MoodLog).where(MoodLog.user_id==user.id, MoodLog.day==day, MoodLog.slot==slot)).first()
     if existing:
+        if existing.mood != m:
+            rollup.bump(session, user.id, day, **{rollup.mood_column(existing.mood): -1, rollup.mood_column(m): 1})
         existing.mood = m; existing.created_at = datetime.utcnow()
         session.add(existing); session.commit()
     else:
-        session.add(MoodLog(user_id=user.id, day=day, slot=slot, mood=m)); session.commit()
+        session.add(MoodLog(user_id=user.id, day=day, slot=slot, mood=m))
+        rollup.bump(session, user.id, day, **{rollup.mood_column(m): 1})
+        try:
+            session.commit()
+        except IntegrityError:
+            # a concurrent tap inserted this slot first; retry as an update
+            session.rollback()
+            return mood_set(req, user, session)
     return {"ok": True, "day": day, "slot": slot, "mood": m, "icon": MOODS[m]}
 
 @app.get("/mood/today", response_model=MoodSummaryOut)
@@ -275,7 +581,9 @@ def todo_update(todo_id: int, patch: TodoUpdateRequest, user: User = Depends(get
         new_done = bool(patch.done)
         if new_done and not old_done:
             it.done = True; it.completed_at = datetime.utcnow()
-            session.add(BadgeEarned(user_id=user.id, title=it.title))
+            day = _local_day(patch.tz_offset_minutes)
+            session.add(BadgeEarned(user_id=user.id, title=it.title, day=day))
+            rollup.bump(session, user.id, day, badges_count=1)
         elif not new_done and old_done:
             it.done = False; it.completed_at = None
     session.add(it); session.commit(); session.refresh(it)
@@ -390,12 +698,139 @@ def activities_complete(key: str = Form(...), title: str = Form(...), points: in
     row = session.exec(select(ActivityLog).where(ActivityLog.user_id==user.id, ActivityLog.day==day, ActivityLog.key==key)).first()
     now = datetime.utcnow()
     if row:
+        if not row.completed: rollup.bump(session, user.id, day, activity_points=row.points)
         row.completed = True; row.completed_at = now
         session.add(row)
     else:
         row = ActivityLog(user_id=user.id, day=day, key=key, title=title, points=int(points), completed=True, completed_at=now)
         session.add(row)
+        rollup.bump(session, user.id, day, activity_points=row.points)
     # Award a badge for each activity completion
-    session.add(BadgeEarned(user_id=user.id, title=f"Activity: {title}"))
-    session.commit(); session.refresh(row)
-    return ActivityStatus(key=row.key, title=row.title, points=row.points, completed=row.completed, completed_at=row.completed_at)
\ No newline at end of file
+    session.add(BadgeEarned(user_id=user.id, title=f"Activity: {title}", day=day))
+    rollup.bump(session, user.id, day, badges_count=1)
+    try:
+        session.commit()
+    except IntegrityError:
+        # a concurrent request logged this activity first; retry against its row
+        session.rollback()
+        return activities_complete(key, title, points, tz_offset_minutes, user, session)
+    session.refresh(row)
+    return ActivityStatus(key=row.key, title=row.title, points=row.points, completed=row.completed, completed_at=row.completed_at)
+
+# -------- Coach chat --------
+def _coach_turn(session: Session, user: User, req: CoachChatRequest, shared: bool = False):
+    """Store the user's message and return (conversation id, full transcript, coach model, shared facts)."""
+    if req.conversation_id is not None:
+        conv = _own_conversation(session, user, req.conversation_id)
+    else:
+        conv = ChatConversation(user_id=user.id, title=req.message.strip()[:60], shared_facts=shared)
+        session.add(conv); session.flush()
+    # routed once per conversation, so follow-ups keep the model (and its prompt cache) of the opening answer
+    if conv.model not in coach.COACH_MODELS: conv.model = coach.route(req.message)
+    session.add(ChatMessage(conversation_id=conv.id, role="user", content=req.message))
+    conv.updated_at = datetime.utcnow(); session.add(conv)
+    session.commit()
+    rows = session.exec(select(ChatMessage.role, ChatMessage.content)
+                        .where(ChatMessage.conversation_id == conv.id).order_by(ChatMessage.id)).all()
+    return conv.id, [{"role": r, "content": c} for r, c in rows], conv.model, conv.shared_facts
+
+def _save_reply(conv_id: int, text: str, stats: dict) -> dict:
+    with Session(engine) as s:
+        m = ChatMessage(conversation_id=conv_id, role="assistant", content=text,
+                        ttft_ms=stats.get("ttft_ms"), prompt_tokens=stats.get("prompt_eval_count"))
+        s.add(m)
+        conv = s.get(ChatConversation, conv_id)
+        if conv: conv.updated_at = datetime.utcnow(); s.add(conv)
+        s.commit()
+        return {"conversation_id": conv_id, "message_id": m.id}
+
+async def _coach_events(ticket: Optional[coach.Ticket], conv_id: int, prompt: Optional[list], model: str,
+                        cached: Optional[str] = None, cache_key: Optional[tuple] = None, cache_vec=None):
+    async def done(text: str, stats: dict):
+        if cache_key is not None: answer_cache.store(cache_key, text, cache_vec)
+        return await run_in_threadpool(_save_reply, conv_id, text, stats)
+    try:
+        yield coach.sse({"conversation_id": conv_id}, "meta")
+        frames = coach.stream_cached(cached, done) if cached is not None else coach.stream_chat(ticket, prompt, model, on_complete=done)
+        async for frame in frames:
+            yield frame
+    finally:
+        if ticket: ticket.release()
+
+@app.post("/coach/chat")
+async def coach_chat(req: CoachChatRequest, user: User = Depends(get_user), session: Session = Depends(get_session)):
+    """Stream the coach's reply as Server-Sent Events (see api/coach.py); the transcript is stored."""
+    if not req.message.strip(): raise HTTPException(400, "Empty message")
+    bmi = _compute_bmi(user)
+    # only opening questions are cached: later turns depend on the conversation so far
+    key = cached = vec = None
+    if req.conversation_id is None and answer_cache.enabled:
+        if req.no_cache: answer_cache.bypassed += 1
+        else:
+            key = answer_cache.key(req.message, _bmi_band(bmi), user.activity_level)
+            cached, vec = await answer_cache.lookup(key)
+    # the scheduler place is taken now, so requests admitted together can't overrun COACH_QUEUE_DEPTH
+    ticket = coach.scheduler.admit(user.id) if cached is None else None
+    try:
+        conv_id, transcript, model, shared = await run_in_threadpool(_coach_turn, session, user, req, key is not None)
+    except BaseException:
+        if ticket: ticket.release()
+        raise
+    prompt = None
+    if cached is None:
+        # a reply that goes into the shared cache may only depend on what the cache key holds; its follow-ups
+        # keep those facts, so the system message (and the model host's prompt cache) stays the same all chat
+        facts = (conversation.bucket_facts(_bmi_band(bmi), user.activity_level) if shared else
+                 conversation.profile_facts(user.name, user.age_years, user.gender, bmi, _bmi_band(bmi), user.activity_level, user.kcal_goal))
+        prompt = conversation.build(transcript, facts)
+    events = _coach_events(ticket, conv_id, prompt, model, cached, key if cached is None else None, vec)
+    if ticket: weakref.finalize(events, ticket.release)  # a response that is never streamed still frees its place
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/coach/conversations", response_model=List[ConversationOut])
+def coach_conversations(limit: int = Query(default=20, ge=1, le=100), user: User = Depends(get_user), session: Session = Depends(get_session)):
+    rows = session.exec(select(ChatConversation).where(ChatConversation.user_id == user.id)
+                        .order_by(ChatConversation.updated_at.desc()).limit(limit)).all()
+    return [ConversationOut(**r.model_dump()) for r in rows]
+
+def _own_conversation(session: Session, user: User, conv_id: int) -> ChatConversation:
+    conv = session.get(ChatConversation, conv_id)
+    if not conv or conv.user_id != user.id: raise HTTPException(404, "Conversation not found")
+    return conv
+
+@app.get("/coach/conversations/{conv_id}", response_model=ConversationDetail)
+def coach_conversation(conv_id: int, user: User = Depends(get_user), session: Session = Depends(get_session)):
+    conv = _own_conversation(session, user, conv_id)
+    msgs = session.exec(select(ChatMessage).where(ChatMessage.conversation_id == conv.id).order_by(ChatMessage.id)).all()
+    return ConversationDetail(**conv.model_dump(), messages=[ChatMessageOut(**m.model_dump()) for m in msgs])
+
+@app.delete("/coach/conversations/{conv_id}")
+def coach_conversation_delete(conv_id: int, user: User = Depends(get_user), session: Session = Depends(get_session)):
+    conv = _own_conversation(session, user, conv_id)
+    session.execute(ChatMessage.__table__.delete().where(ChatMessage.conversation_id == conv.id))
+    session.delete(conv); session.commit()
+    return {"ok": True}
+
+# -------- Dashboard --------
+DASHBOARD_SECTIONS = {
+    "profile": lambda u, s, tz: get_profile(user=u, session=s),
+    "mood": lambda u, s, tz: mood_today(tz_offset_minutes=tz, user=u, session=s),
+    "todo": lambda u, s, tz: todo_list(user=u, session=s),
+    "activities": lambda u, s, tz: activities_recommend(tz_offset_minutes=tz, user=u, session=s),
+    "activities_status": lambda u, s, tz: activities_status_today(tz_offset_minutes=tz, user=u, session=s),
+    "badges": lambda u, s, tz: badges_today(tz_offset_minutes=tz, user=u, session=s),
+    "summary_daily": lambda u, s, tz: daily_summary(date_str=None, tz_offset_minutes=tz, user=u, session=s),
+    "summary_weekly": lambda u, s, tz: weekly_summary(end_str=None, tz_offset_minutes=tz, user=u, session=s),
+    "items": lambda u, s, tz: list_items(limit=20, cursor=None, user=u, session=s),
+    "journal": lambda u, s, tz: journal_today(tz_offset_minutes=tz, user=u, session=s),
+}
+
+@app.get("/dashboard", response_model=DashboardOut)
+def dashboard(sections: Optional[str] = Query(default=None, description="comma-separated; default all"),
+              tz_offset_minutes: int = Query(default=0, ge=-24*60, le=24*60),
+              user: User = Depends(get_user), session: Session = Depends(get_session)):
+    """Everything the home page renders, with one auth check and one DB session."""
+    wanted = [x.strip() for x in sections.split(",") if x.strip()] if sections else list(DASHBOARD_SECTIONS)
+    unknown = [x for x in wanted if x not in DASHBOARD_SECTIONS]
+    if unknown: raise HTTPException(400, f"Unknown sections: {', '.join(unknown)}")
+    return DashboardOut(**{name: DASHBOARD_SECTIONS[name](user, session, tz_offset_minutes) for name in wanted})
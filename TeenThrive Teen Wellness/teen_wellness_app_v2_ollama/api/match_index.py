@@ -0,0 +1,184 @@
+"""In-memory per-user photo match index.
+
+Each user's labeled FoodItems are held as packed uint64 hashes plus one
+contiguous float32 histogram matrix, so a prediction is one batched NumPy
+pass (popcount of XOR + matrix-vector cosine) instead of a Python loop.
+
+Large indexes prune candidates first with a pigeonhole multi-index: the 192
+hash bits are cut into MAX_HASH_DISTANCE + 1 disjoint substrings, and any
+item within the combined distance threshold must agree exactly with the
+query on at least one of them. Only bucket hits reach the scoring stage, so
+results are identical to the brute-force scan.
+"""
+import os, threading
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+import numpy as np
+
+from .matcher import MAX_HASH_DISTANCE, MIN_HIST_SIM
+
+HASH_KEYS = ("phash", "ahash", "dhash")
+HIST_DIM = 768
+
+# pigeonhole chunks over the concatenated phash|ahash|dhash bits
+N_CHUNKS = MAX_HASH_DISTANCE + 1
+_BITS = 64 * len(HASH_KEYS)
+_WIDTHS = [_BITS // N_CHUNKS + (1 if c < _BITS % N_CHUNKS else 0) for c in range(N_CHUNKS)]
+_OFFSETS = [sum(_WIDTHS[:c]) for c in range(N_CHUNKS)]
+PRUNE_MIN_ITEMS = 256  # below this a full vectorized scan is cheaper than bucket lookups
+
+# numpy 1.26 has no bitwise_count, so popcount goes through a byte table
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def hash_to_int(h) -> int:
+    """Hex string or stored signed int64 -> unsigned 64-bit value."""
+    if isinstance(h, (int, np.integer)): return int(h) & 0xFFFFFFFFFFFFFFFF
+    return int(str(h), 16)
+
+def popcount64(x: np.ndarray) -> np.ndarray:
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.int32)
+
+def chunk_keys(hashes) -> list[int]:
+    """Split the three 64-bit hashes into the N_CHUNKS pigeonhole keys."""
+    v = 0
+    for h in hashes: v = (v << 64) | hash_to_int(h)
+    return [(v >> off) & ((1 << w) - 1) for off, w in zip(_OFFSETS, _WIDTHS)]
+
+class MatchIndex:
+    """Growable arrays of one user's labeled items, updated incrementally."""
+
+    def __init__(self, capacity: int = 64):
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._cal = np.zeros(capacity, dtype=np.int32)
+        self._hashes = np.zeros((capacity, len(HASH_KEYS)), dtype=np.uint64)
+        self._hist = np.zeros((capacity, HIST_DIM), dtype=np.float32)
+        self._norms = np.zeros(capacity, dtype=np.float32)
+        self._pos: dict[int, int] = {}
+        self._buckets: list[dict[int, set]] = [{} for _ in range(N_CHUNKS)]
+        self._n = 0
+        self.max_id = 0  # high-water mark of rows seen by sync(); add() leaves it alone
+        self.lock = threading.RLock()
+
+    def __len__(self): return self._n
+
+    def _grow(self):
+        cap = max(64, len(self._ids) * 2)
+        for name in ("_ids", "_cal", "_hashes", "_hist", "_norms"):
+            old = getattr(self, name)
+            new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, name, new)
+
+    def add(self, item_id: int, calories: int, hashes: dict, hist: np.ndarray):
+        with self.lock:
+            if item_id in self._pos: return
+            if self._n == len(self._ids): self._grow()
+            i = self._n
+            h = np.asarray(hist, dtype=np.float32).reshape(-1)
+            hv = [hash_to_int(hashes[k]) for k in HASH_KEYS]
+            self._ids[i] = item_id
+            self._cal[i] = int(calories)
+            self._hashes[i] = hv
+            for bucket, key in zip(self._buckets, chunk_keys(hv)):
+                bucket.setdefault(key, set()).add(item_id)
+            self._hist[i] = h
+            self._norms[i] = np.linalg.norm(h)
+            self._pos[item_id] = i
+            self._n += 1
+
+    def remove(self, item_id: int):
+        with self.lock:
+            i = self._pos.pop(item_id, None)
+            if i is None: return
+            for bucket, key in zip(self._buckets, chunk_keys(self._hashes[i].tolist())):
+                ids = bucket.get(key)
+                if ids is not None:
+                    ids.discard(item_id)
+                    if not ids: del bucket[key]
+            last = self._n - 1
+            if i != last:
+                # swap-remove keeps the live rows contiguous
+                for arr in (self._ids, self._cal, self._hashes, self._hist, self._norms):
+                    arr[i] = arr[last]
+                self._pos[int(self._ids[i])] = i
+            self._n = last
+
+    def _candidates(self, q_hashes) -> np.ndarray:
+        found = set()
+        for bucket, key in zip(self._buckets, chunk_keys(q_hashes)):
+            ids = bucket.get(key)
+            if ids: found |= ids
+        return np.fromiter((self._pos[i] for i in found), dtype=np.int64, count=len(found))
+
+    def _score(self, rows: np.ndarray, q_hashes: np.ndarray, q_hist: np.ndarray):
+        hd = popcount64(self._hashes[rows] ^ q_hashes).sum(axis=1)
+        qn = float(np.linalg.norm(q_hist))
+        cs = (self._hist[rows] @ q_hist) / (self._norms[rows] * qn + 1e-8)
+        ok = (hd <= MAX_HASH_DISTANCE) & (cs >= MIN_HIST_SIM)
+        conf = (1.0 - np.minimum(hd / MAX_HASH_DISTANCE, 1.0)) * 0.5 + cs * 0.5
+        return ok, conf, hd
+
+    def matches(self, q_hash: dict, q_hist: np.ndarray, k: Optional[int] = None):
+        """Accepted matches as (item_id, calories, confidence, hash_distance), best first.
+
+        Same decision as `match_confidence` over every row, ordered by highest
+        confidence, then lowest hash distance, then newest item.
+        """
+        q_hashes = np.array([hash_to_int(q_hash[key]) for key in HASH_KEYS], dtype=np.uint64)
+        q_hist = np.asarray(q_hist, dtype=np.float32).reshape(-1)
+        with self.lock:
+            if self._n == 0: return []
+            rows = self._candidates(q_hashes.tolist()) if self._n >= PRUNE_MIN_ITEMS else np.arange(self._n)
+            if rows.size == 0: return []
+            ok, conf, hd = self._score(rows, q_hashes, q_hist)
+            rows, conf, hd = rows[ok], conf[ok], hd[ok]
+            order = np.lexsort((-self._ids[rows], hd, -conf))[:k]
+            return [(int(self._ids[rows[j]]), int(self._cal[rows[j]]), float(conf[j]), int(hd[j])) for j in order]
+
+def sync(idx: MatchIndex, loader: Callable[[int], Iterable[tuple]]) -> MatchIndex:
+    """Append rows from `loader(after_id)`, which yields (id, calories, hashes, hist) with id > after_id."""
+    with idx.lock:
+        for item_id, calories, hashes, hist in loader(idx.max_id):
+            if calories is not None: idx.add(item_id, calories, hashes, hist)
+            idx.max_id = max(idx.max_id, int(item_id))
+    return idx
+
+class IndexRegistry:
+    """Per-user MatchIndex cache, built lazily on first prediction.
+
+    Holds at most `maxsize` users (about 3 KB per item each); the least
+    recently used index is dropped and simply rebuilt by its loader next time.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = max(1, maxsize)
+        self._indexes: "OrderedDict[int, MatchIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, user_id: int, loader: Callable[[int], Iterable[tuple]]) -> MatchIndex:
+        """Index for `user_id`, synced through `loader` on every lookup.
+
+        Syncing each time picks up items written by other workers with one
+        cheap indexed query.
+        """
+        with self._lock:
+            idx = self._indexes.get(user_id)
+            if idx is None:
+                idx = self._indexes[user_id] = MatchIndex()
+                while len(self._indexes) > self.maxsize:
+                    self._indexes.popitem(last=False); self.evictions += 1
+            self._indexes.move_to_end(user_id)
+        return sync(idx, loader)
+
+    def peek(self, user_id: int) -> Optional[MatchIndex]:
+        return self._indexes.get(user_id)
+
+    def stats(self) -> dict:
+        return {"users": len(self._indexes), "maxsize": self.maxsize, "items": sum(map(len, list(self._indexes.values()))),
+                "evictions": self.evictions}
+
+indexes = IndexRegistry(int(os.getenv("MATCH_INDEX_USERS", "1000")))
+# Cross-user catalog of labeled items from users with User.share_foods set
+catalog = MatchIndex()
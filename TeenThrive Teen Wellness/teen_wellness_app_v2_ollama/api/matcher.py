@@ -1,33 +1,63 @@
 from PIL import Image
-import imagehash, numpy as np
+import io, imagehash, numpy as np
 
 MAX_HASH_DISTANCE = 12
 MIN_HIST_SIM = 0.80
+HIST_DTYPE = np.float16  # unit-norm histogram, stored as raw bytes in FoodItem.hist
 
-def compute_hashes(img: Image.Image):
-    im = img.convert("RGB")
+FEATURE_MAX_SIDE = 512  # hashes shrink to <= 32px and the histogram is normalized, so this is plenty
+_CHANNEL_OFFSETS = np.array([0, 256, 512], dtype=np.uint16)
+
+def _prepare(img: Image.Image) -> Image.Image:
+    """Decode once at reduced size and return an RGB image no larger than ~2x FEATURE_MAX_SIDE."""
+    img.draft("RGB", (FEATURE_MAX_SIDE, FEATURE_MAX_SIDE))  # JPEG: DCT-domain downscale, no-op otherwise
+    if img.mode not in ("RGB", "L"): img = img.convert("RGB")
+    factor = max(img.size) // FEATURE_MAX_SIDE
+    if factor >= 2: img = img.reduce(factor)
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+def _hashes_from_gray(gray: Image.Image):
     return {
-        "phash": str(imagehash.phash(im)),
-        "ahash": str(imagehash.average_hash(im)),
-        "dhash": str(imagehash.dhash(im)),
+        "phash": str(imagehash.phash(gray)),
+        "ahash": str(imagehash.average_hash(gray)),
+        "dhash": str(imagehash.dhash(gray)),
     }
 
+def compute_hashes(img: Image.Image):
+    return _hashes_from_gray(img.convert("L"))
+
 def _color_histogram(im: Image.Image) -> np.ndarray:
-    arr = np.array(im.convert("RGB"))
-    hist = []
-    for ch in range(3):
-        h, _ = np.histogram(arr[:,:,ch], bins=256, range=(0,255))
-        hist.append(h.astype(np.float32))
-    h = np.concatenate(hist).astype(np.float32)
+    arr = np.asarray(im if im.mode == "RGB" else im.convert("RGB"))
+    # one bincount over (pixel value + channel offset) == three 256-bin np.histogram calls
+    idx = arr.reshape(-1, 3).astype(np.uint16) + _CHANNEL_OFFSETS
+    h = np.bincount(idx.ravel(), minlength=768).astype(np.float32)
     h /= (np.linalg.norm(h) + 1e-8)
     return h
 
 def compute_features(img: Image.Image):
-    im = img.convert("RGB")
-    hashes = compute_hashes(im)
+    im = _prepare(img)
+    hashes = _hashes_from_gray(im.convert("L"))
     hist = _color_histogram(im)
     return hashes, hist
 
+def extract_features(content: bytes):
+    """Decode raw upload bytes and compute features; picklable entry point for worker pools."""
+    try:
+        return compute_features(Image.open(io.BytesIO(content)))
+    except Exception as e:
+        raise ValueError(f"Invalid image: {e}") from None
+
+def hash_to_int64(h: str) -> int:
+    """64-bit hex hash -> signed int that fits an SQLite INTEGER column."""
+    v = int(h, 16)
+    return v - (1 << 64) if v >= (1 << 63) else v
+
+def hist_to_blob(h: np.ndarray) -> bytes:
+    return np.asarray(h, dtype=HIST_DTYPE).tobytes()
+
+def blob_to_hist(b: bytes) -> np.ndarray:
+    return np.frombuffer(b, dtype=HIST_DTYPE)
+
 def _hash_distance(h1: dict, h2: dict) -> int:
     d = 0
     d += imagehash.hex_to_hash(h1["phash"]) - imagehash.hex_to_hash(h2["phash"])
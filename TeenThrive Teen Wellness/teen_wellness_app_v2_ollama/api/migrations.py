@@ -0,0 +1,172 @@
+"""Versioned schema migrations.
+
+`schema_version` records every migration applied to the database. `upgrade()`
+runs the pending entries of MIGRATIONS in order and records each one as it
+finishes, so an interrupted upgrade resumes where it stopped. Once the
+database is at head, startup is a single SELECT with no schema introspection.
+
+Migrations must be safe to re-run: databases created before this runner
+existed start at version 0 even if some steps were already applied by hand.
+Data backfills work in chunks and commit after each chunk, so other
+connections can write between chunks instead of waiting on one long
+transaction.
+
+    python -m api.migrations          # upgrade to head
+    python -m api.migrations --status
+"""
+import json, numpy as np
+from datetime import datetime
+from sqlmodel import SQLModel, Session, select
+from sqlalchemy import func, delete, inspect, text, update
+from sqlalchemy.exc import IntegrityError
+
+from .models import User, FoodItem, BadgeEarned, MoodLog, ActivityLog, ChatConversation, ChatMessage
+from .matcher import hash_to_int64, hist_to_blob
+from . import rollup
+
+BACKFILL_CHUNK = 500
+
+def _create_tables(engine):
+    SQLModel.metadata.create_all(engine)
+
+def _fooditem_binary(engine, chunk: int = BACKFILL_CHUNK):
+    """Rebuild a legacy SQLite fooditem table (hex hashes + hist_json text) with binary columns."""
+    if engine.dialect.name != "sqlite": return
+    tables = inspect(engine).get_table_names()
+    if "fooditem_legacy" not in tables:
+        if "hist_json" not in [c["name"] for c in inspect(engine).get_columns("fooditem")]: return
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS ix_fooditem_user_id"))
+            conn.execute(text("ALTER TABLE fooditem RENAME TO fooditem_legacy"))
+    # outside the branch: a run that died right after the rename left no fooditem table
+    SQLModel.metadata.create_all(engine, tables=[FoodItem.__table__])
+    # copy by id range, one transaction per chunk; resumes after the last copied id if interrupted
+    with engine.connect() as conn:
+        last = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM fooditem")).scalar()
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text("SELECT id, user_id, path, calories, phash, ahash, dhash, hist_json, created_at "
+                                     "FROM fooditem_legacy WHERE id > :last ORDER BY id LIMIT :n"), {"last": last, "n": chunk}).all()
+            if not rows: break
+            conn.execute(FoodItem.__table__.insert(), [
+                {"id": i, "user_id": u, "path": p, "calories": c, "phash": hash_to_int64(ph), "ahash": hash_to_int64(ah),
+                 "dhash": hash_to_int64(dh), "hist": hist_to_blob(np.array(json.loads(hj), dtype=np.float32)),
+                 "created_at": datetime.fromisoformat(ts) if isinstance(ts, str) else ts}
+                for (i, u, p, c, ph, ah, dh, hj, ts) in rows])
+            last = rows[-1][0]
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE fooditem_legacy"))
+
+# columns added to tables after their first release
+ADDED_COLUMNS = {
+    User.__table__: ("name", "gender", "age_years", "height_cm", "weight_kg", "activity_level", "kcal_goal", "share_foods"),
+    FoodItem.__table__: ("day",),
+    BadgeEarned.__table__: ("day",),
+}
+
+def _added_columns(engine, columns: dict = ADDED_COLUMNS):
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table, names in columns.items():
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for name in names:
+                if name in have: continue
+                col = table.c[name]
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN {name} {col.type.compile(engine.dialect)}'
+                if not col.nullable: ddl += " NOT NULL DEFAULT " + ("0" if engine.dialect.name == "sqlite" else "false")
+                conn.execute(text(ddl))
+
+def _backfill_days(engine, chunk: int = BACKFILL_CHUNK):
+    """Rows logged before FoodItem/BadgeEarned carried a local day fall back to their UTC date."""
+    for model in (FoodItem, BadgeEarned):
+        t = model.__table__
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(select(t.c.id, t.c.created_at).where(t.c.day == None).limit(chunk)).all()
+                for rid, created in rows:
+                    conn.execute(update(t).where(t.c.id == rid).values(day=created.date().isoformat()))
+            if len(rows) < chunk: break
+
+# unique per-day indexes and the columns identifying a duplicate; the newest row of each group is kept
+UNIQUE_DEDUPE = {MoodLog.__table__: ("user_id", "day", "slot"), ActivityLog.__table__: ("user_id", "day", "key")}
+
+def _indexes(engine):
+    """Create any index declared on the models but missing from the database."""
+    with engine.begin() as conn:
+        insp = inspect(conn)
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+            for ix in table.indexes:
+                if ix.name in existing: continue
+                if ix.unique and table in UNIQUE_DEDUPE:
+                    keep = select(func.max(table.c.id)).group_by(*[table.c[c] for c in UNIQUE_DEDUPE[table]])
+                    conn.execute(delete(table).where(table.c.id.not_in(keep)))
+                ix.create(conn)
+
+def _rollups(engine):
+    # one user per transaction keeps each write lock short on large installs
+    with Session(engine) as s:
+        for uid in s.exec(select(User.id).order_by(User.id)).all():
+            rollup.rebuild(s, uid)
+
+def _chat_tables(engine):
+    SQLModel.metadata.create_all(engine, tables=[ChatConversation.__table__, ChatMessage.__table__])
+
+def _todo_index_desc(engine):
+    # the to-do list sorts done ASC, created_at DESC; SQLite only skips the sort with an index in that order
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_todoitem_user_done_created"))
+    _indexes(engine)
+
+def _conversation_model(engine):
+    _added_columns(engine, {ChatConversation.__table__: ("model",)})
+
+def _conversation_shared_facts(engine):
+    _added_columns(engine, {ChatConversation.__table__: ("shared_facts",)})
+
+# (version, name, step) in the order they run; append new entries, never reorder or edit applied ones
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "fooditem binary hashes and histograms", _fooditem_binary),
+    (3, "added profile and day columns", _added_columns),
+    (4, "backfill local days", _backfill_days),
+    (5, "composite and unique indexes", _indexes),
+    (6, "daily rollups", _rollups),
+    (7, "coach chat transcripts", _chat_tables),
+    (8, "refresh token expiry indexes", _indexes),
+    (9, "to-do index in list order", _todo_index_desc),
+    (10, "coach model per conversation", _conversation_model),
+    (11, "coach profile facts per conversation", _conversation_shared_facts),
+]
+HEAD = MIGRATIONS[-1][0]
+
+def current_version(engine) -> int:
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at TIMESTAMP)"))
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+def upgrade(engine, log=None) -> int:
+    """Apply pending migrations; returns the number applied."""
+    version = current_version(engine)
+    pending = [m for m in MIGRATIONS if m[0] > version]
+    for v, name, step in pending:
+        if log: log(f"migrating to {v}: {name}")
+        step(engine)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                             {"v": v, "n": name, "t": datetime.utcnow()})
+        except IntegrityError:
+            pass  # another worker starting at the same time recorded it first
+    return len(pending)
+
+if __name__ == "__main__":
+    import argparse
+    from .db import engine
+    ap = argparse.ArgumentParser(description="Apply pending schema migrations")
+    ap.add_argument("--status", action="store_true", help="only print the current and head versions")
+    args = ap.parse_args()
+    if args.status:
+        print(f"schema version {current_version(engine)}, head {HEAD}")
+    else:
+        print(f"applied {upgrade(engine, log=print)} migration(s); at version {HEAD}")
@@ -1,5 +1,6 @@
 from typing import Optional
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index, desc
 from datetime import datetime
 
 class User(SQLModel, table=True):
@@ -13,20 +14,35 @@ class User(SQLModel, table=True):
     weight_kg: Optional[float] = Field(default=None)
     activity_level: Optional[str] = Field(default="moderate")
     kcal_goal: Optional[int] = Field(default=2000)
+    share_foods: bool = Field(default=False)  # opt-in to the cross-user food catalog
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class FoodItem(SQLModel, table=True):
+    __table_args__ = (Index("ix_fooditem_user_created_id", "user_id", "created_at", "id"),  # keyset paging
+                      Index("ix_fooditem_user_day", "user_id", "day"))
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
-    path: str
+    path: str = Field(index=True)  # relative to storage root (see api/storage.py); legacy rows are absolute
     calories: Optional[int] = None
-    phash: str
-    ahash: str
-    dhash: str
-    hist_json: str
+    phash: int  # 64-bit hashes as signed ints, see matcher.hash_to_int64
+    ahash: int
+    dhash: int
+    hist: bytes  # 768-bin histogram, matcher.HIST_DTYPE bytes
+    day: Optional[str] = Field(default=None)  # YYYY-MM-DD local day when logged
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class RefreshToken(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    token_hash: str = Field(index=True, unique=True)  # sha256 of the opaque token; the token itself is never stored
+    family: str = Field(index=True)  # one login session; rotation keeps the family, logout/reuse revokes it
+    expires_at: datetime = Field(index=True)
+    revoked_at: Optional[datetime] = Field(default=None, index=True)  # rotated, or its family revoked
+    family_revoked: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class MoodLog(SQLModel, table=True):
+    __table_args__ = (Index("ux_moodlog_user_day_slot", "user_id", "day", "slot", unique=True),)  # one mood per slot
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
     day: str = Field(index=True)  # YYYY-MM-DD
@@ -35,6 +51,7 @@ class MoodLog(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class JournalEntry(SQLModel, table=True):
+    __table_args__ = (Index("ix_journalentry_user_day_created", "user_id", "day", "created_at"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
     day: str = Field(index=True)
@@ -42,6 +59,7 @@ class JournalEntry(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class TodoItem(SQLModel, table=True):
+    __table_args__ = (Index("ix_todoitem_user_done_created_desc", "user_id", "done", desc("created_at")),)  # list order
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
     title: str
@@ -52,12 +70,16 @@ class TodoItem(SQLModel, table=True):
     completed_at: Optional[datetime] = None
 
 class BadgeEarned(SQLModel, table=True):
+    __table_args__ = (Index("ix_badgeearned_user_created", "user_id", "created_at"),
+                      Index("ix_badgeearned_user_day", "user_id", "day"))
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
     title: str
+    day: Optional[str] = Field(default=None)  # YYYY-MM-DD local day when earned
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ActivityLog(SQLModel, table=True):
+    __table_args__ = (Index("ux_activitylog_user_day_key", "user_id", "day", "key", unique=True),)  # one row per activity per day
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
     day: str = Field(index=True)  # YYYY-MM-DD local day
@@ -66,4 +88,38 @@ class ActivityLog(SQLModel, table=True):
     points: int = 10
     completed: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    completed_at: Optional[datetime] = None
\ No newline at end of file
+    completed_at: Optional[datetime] = None
+
+class DailyRollup(SQLModel, table=True):
+    """Per-user, per-local-day counters kept in step with writes (see api/rollup.py)."""
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    day: str = Field(primary_key=True)  # YYYY-MM-DD local day
+    calories: int = 0
+    items_count: int = 0
+    mood_happy: int = 0
+    mood_sad: int = 0
+    mood_angry: int = 0
+    mood_frustrated: int = 0
+    mood_scared: int = 0
+    badges_count: int = 0
+    activity_points: int = 0
+
+class ChatConversation(SQLModel, table=True):
+    __table_args__ = (Index("ix_chatconversation_user_updated", "user_id", "updated_at"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    title: str
+    model: Optional[str] = None  # picked by coach.route() on the opening question, kept for the whole chat
+    shared_facts: bool = False  # opened with a cacheable answer: every turn's prompt holds bucket facts only
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ChatMessage(SQLModel, table=True):
+    __table_args__ = (Index("ix_chatmessage_conversation_id", "conversation_id", "id"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: int = Field(foreign_key="chatconversation.id")
+    role: str  # 'user' or 'assistant'
+    content: str
+    ttft_ms: Optional[int] = None  # assistant replies: time to first token
+    prompt_tokens: Optional[int] = None  # assistant replies: prompt tokens the model evaluated (cached prefix excluded)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,78 @@
+"""Per-user daily rollups maintained on write.
+
+Endpoints that log food, moods, badges or activities call `bump()` inside
+their own transaction, so summaries become primary-key reads on
+DailyRollup instead of scans over raw rows. `rebuild()` recomputes rollups
+from raw rows for backfills:
+
+    python -m api.rollup [--user USER_ID]
+"""
+from collections import defaultdict
+from typing import Optional
+from sqlmodel import Session, select
+from sqlalchemy import func, delete
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import DailyRollup, FoodItem, MoodLog, BadgeEarned, ActivityLog
+
+COUNTERS = ("calories", "items_count", "mood_happy", "mood_sad", "mood_angry", "mood_frustrated",
+            "mood_scared", "badges_count", "activity_points")
+
+def mood_column(mood: str) -> str:
+    return f"mood_{mood}"
+
+def bump(session: Session, user_id: int, day: str, **deltas: int):
+    """Atomically add `deltas` (counter name -> change) to the (user_id, day) rollup row.
+
+    Uses an upsert so concurrent writers never read-modify-write the same row.
+    The caller commits.
+    """
+    deltas = {k: int(v) for k, v in deltas.items() if v}
+    if not deltas: return
+    t = DailyRollup.__table__
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(t).values(user_id=user_id, day=day, **deltas)
+    stmt = stmt.on_conflict_do_update(index_elements=["user_id", "day"],
+                                      set_={k: t.c[k] + stmt.excluded[k] for k in deltas})
+    session.execute(stmt)
+
+def rebuild(session: Session, user_id: Optional[int] = None) -> int:
+    """Recompute rollups from raw rows (all users, or one); returns rows written."""
+    def scoped(q, model):
+        return q.where(model.user_id == user_id) if user_id is not None else q
+
+    # rows logged before FoodItem/BadgeEarned carried a local day fall back to their UTC date
+    for model in (FoodItem, BadgeEarned):
+        for r in session.exec(scoped(select(model).where(model.day == None), model)).all():
+            r.day = r.created_at.date().isoformat(); session.add(r)
+    session.flush()
+
+    acc = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for uid, day, kcal, n in session.exec(scoped(select(FoodItem.user_id, FoodItem.day, func.coalesce(func.sum(FoodItem.calories), 0),
+                                                        func.count(FoodItem.id)), FoodItem).group_by(FoodItem.user_id, FoodItem.day)):
+        acc[(uid, day)]["calories"] += int(kcal); acc[(uid, day)]["items_count"] += int(n)
+    for uid, day, mood, n in session.exec(scoped(select(MoodLog.user_id, MoodLog.day, MoodLog.mood, func.count(MoodLog.id)), MoodLog)
+                                          .group_by(MoodLog.user_id, MoodLog.day, MoodLog.mood)):
+        if mood_column(mood) in COUNTERS: acc[(uid, day)][mood_column(mood)] += int(n)
+    for uid, day, n in session.exec(scoped(select(BadgeEarned.user_id, BadgeEarned.day, func.count(BadgeEarned.id)), BadgeEarned)
+                                    .group_by(BadgeEarned.user_id, BadgeEarned.day)):
+        acc[(uid, day)]["badges_count"] += int(n)
+    for uid, day, pts in session.exec(scoped(select(ActivityLog.user_id, ActivityLog.day, func.coalesce(func.sum(ActivityLog.points), 0)), ActivityLog)
+                                      .where(ActivityLog.completed == True).group_by(ActivityLog.user_id, ActivityLog.day)):
+        acc[(uid, day)]["activity_points"] += int(pts)
+
+    session.execute(scoped(delete(DailyRollup), DailyRollup))
+    session.add_all([DailyRollup(user_id=uid, day=day, **counts) for (uid, day), counts in acc.items()])
+    session.commit()
+    return len(acc)
+
+if __name__ == "__main__":
+    import argparse
+    from .db import engine
+    from .migrations import upgrade
+    ap = argparse.ArgumentParser(description="Rebuild DailyRollup rows from raw data")
+    ap.add_argument("--user", type=int, default=None, help="only this user id")
+    args = ap.parse_args()
+    upgrade(engine)
+    with Session(engine) as s:
+        print(f"rebuilt {rebuild(s, args.user)} rollup rows")
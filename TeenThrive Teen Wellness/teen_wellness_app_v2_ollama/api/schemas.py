@@ -13,6 +13,11 @@ class LoginRequest(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    expires_in: Optional[int] = None  # access token lifetime in seconds
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class ProfileUpdate(BaseModel):
     name: Optional[str] = None
@@ -22,6 +27,7 @@ class ProfileUpdate(BaseModel):
     weight_kg: Optional[float] = None
     activity_level: Optional[str] = None
     kcal_goal: Optional[int] = None
+    share_foods: Optional[bool] = None
 
 class ProfileOut(BaseModel):
     email: str
@@ -32,6 +38,7 @@ class ProfileOut(BaseModel):
     weight_kg: Optional[float]
     activity_level: Optional[str]
     kcal_goal: Optional[int]
+    share_foods: bool = False
     created_at: datetime
 
 class PredictOut(BaseModel):
@@ -40,6 +47,9 @@ class PredictOut(BaseModel):
     confidence: float = 0.0
     match_item_id: Optional[int] = None
     saved_item_id: Optional[int] = None
+    calorie_spread: Optional[int] = None  # interquartile range across catalog neighbours
+    neighbors: int = 0
+    source: str = "own"  # "own" or "catalog"
     hint: str = ""
 
 class ItemRow(BaseModel):
@@ -47,6 +57,12 @@ class ItemRow(BaseModel):
     calories: Optional[int]
     created_at: datetime
     image_url: str
+    thumb_url: str  # 160px WebP
+    thumb_large_url: str  # 480px WebP
+
+class ItemPage(BaseModel):
+    items: List[ItemRow]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next (older) page
 
 class DailySummary(BaseModel):
     date: date
@@ -60,6 +76,14 @@ class WeeklySummary(BaseModel):
     avg_per_day: float
     days: List[DailySummary]
 
+class RangeSummary(BaseModel):
+    start: date
+    end: date
+    bucket: str  # day | week | month; each bucket's `date` is its first day
+    total_calories: int
+    items_count: int
+    buckets: List[DailySummary]
+
 class MoodSetRequest(BaseModel):
     mood: str
     tz_offset_minutes: int = 0
@@ -96,6 +120,7 @@ class TodoUpdateRequest(BaseModel):
     urgent: Optional[bool] = None
     important: Optional[bool] = None
     done: Optional[bool] = None
+    tz_offset_minutes: int = 0
 
 class TodoItemOut(BaseModel):
     id: int
@@ -121,4 +146,37 @@ class ActivityStatus(BaseModel):
     title: str
     points: int
     completed: bool
-    completed_at: Optional[datetime]
\ No newline at end of file
+    completed_at: Optional[datetime]
+
+class CoachChatRequest(BaseModel):
+    message: str
+    conversation_id: Optional[int] = None  # omit to start a new conversation
+    no_cache: bool = False  # always generate a fresh answer
+
+class ConversationOut(BaseModel):
+    id: int
+    title: str
+    created_at: datetime
+    updated_at: datetime
+
+class ChatMessageOut(BaseModel):
+    id: int
+    role: str
+    content: str
+    created_at: datetime
+
+class ConversationDetail(ConversationOut):
+    messages: List[ChatMessageOut]
+
+class DashboardOut(BaseModel):
+    # each field is filled only when its section is requested
+    profile: Optional[ProfileOut] = None
+    mood: Optional[MoodSummaryOut] = None
+    todo: Optional[List[TodoItemOut]] = None
+    activities: Optional[List[ActivityReco]] = None
+    activities_status: Optional[List[ActivityStatus]] = None
+    badges: Optional[List[BadgeOut]] = None
+    summary_daily: Optional[DailySummary] = None
+    summary_weekly: Optional[WeeklySummary] = None
+    items: Optional[ItemPage] = None
+    journal: Optional[List[JournalEntryOut]] = None
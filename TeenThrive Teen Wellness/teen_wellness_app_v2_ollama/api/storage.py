@@ -0,0 +1,64 @@
+"""Content-addressed photo storage.
+
+Each distinct upload is stored once as <root>/<aa>/<bb>/<sha256>.jpg and
+written through a temp file + atomic rename, so readers never see partial
+files. FoodItem.path holds the path relative to the storage root; the file
+is shared by every row with the same content and unlinked with the last one
+(see release()).
+"""
+import hashlib, os, secrets, tempfile
+
+def content_key(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+def rel_path(key: str) -> str:
+    return f"{key[:2]}/{key[2:4]}/{key}.jpg"
+
+_umask = os.umask(0); os.umask(_umask)
+FILE_MODE = 0o644 & ~_umask  # what open() would give; mkstemp files start out 0600
+
+def write_atomic(dest: str, write):
+    """Create `dest` via a temp file in its directory: `write(fileobj)`, chmod, then atomic rename."""
+    d = os.path.dirname(dest)
+    os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as out: write(out)
+        os.chmod(tmp, FILE_MODE)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+def put(root: str, content: bytes) -> str:
+    """Store `content` if not already present and return its relative path."""
+    rel = rel_path(content_key(content))
+    dest = os.path.join(root, rel)
+    if not os.path.exists(dest): write_atomic(dest, lambda out: out.write(content))
+    return rel
+
+def url_path(path: str) -> str:
+    """Path under the /static mount; legacy rows hold absolute paths of flat files."""
+    return os.path.basename(path) if os.path.isabs(path) else path
+
+def resolve(root: str, path: str) -> str:
+    return os.path.join(root, url_path(path))
+
+def release(root: str, path: str, in_use) -> bool:
+    """Unlink `path` unless `in_use()` finds a row still referencing it; True if it was removed.
+
+    The file is moved aside before `in_use()` is asked, so an upload that commits a row
+    meanwhile either is seen by the check (the file is moved back) or re-creates the file
+    with its own put() after its commit.
+    """
+    src = resolve(root, path)
+    aside = os.path.join(os.path.dirname(src), f".del-{secrets.token_hex(8)}")
+    try:
+        os.replace(src, aside)
+    except FileNotFoundError:
+        return False
+    if in_use():
+        os.replace(aside, src)
+        return False
+    os.remove(aside)
+    return True
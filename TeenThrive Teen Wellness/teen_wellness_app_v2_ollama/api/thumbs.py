@@ -0,0 +1,55 @@
+"""WebP thumbnails for stored photos, generated lazily on first request.
+
+Thumbnails live under <root>/thumbs/<size>/<key>.webp where <key> is the
+original's storage path without extension. Originals are content-addressed
+and never rewritten, so thumbnails are immutable and can be cached forever.
+"""
+import os, re
+from PIL import Image
+
+from . import storage
+
+SIZES = (160, 480)
+THUMB_DIR = "thumbs"
+
+# content-addressed "<aa>/<bb>/<sha256>" or a legacy flat file's basename; nothing else is ever served
+_KEY = re.compile(r"(?P<a>[0-9a-f]{2})/(?P<b>[0-9a-f]{2})/(?P=a)(?P=b)[0-9a-f]{60}|[A-Za-z0-9][A-Za-z0-9_-]{0,127}")
+
+def valid_key(key: str) -> bool:
+    return _KEY.fullmatch(key) is not None
+
+def _inside(root: str, path: str) -> bool:
+    root = os.path.realpath(root)
+    return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+def key_for(path: str) -> str:
+    return os.path.splitext(storage.url_path(path))[0]
+
+def url_for(path: str, size: int) -> str:
+    return f"/static/{THUMB_DIR}/{size}/{key_for(path)}.webp"
+
+def _thumb_path(root: str, key: str, size: int) -> str:
+    return os.path.join(root, THUMB_DIR, str(size), key + ".webp")
+
+def ensure(root: str, key: str, size: int) -> str:
+    """Return the thumbnail file for `key`, rendering it from the original if missing.
+
+    Raises FileNotFoundError for keys that are malformed or resolve outside `root`.
+    """
+    dest, src = _thumb_path(root, key, size), os.path.join(root, key + ".jpg")
+    if not valid_key(key) or not _inside(root, src) or not _inside(root, dest):
+        raise FileNotFoundError(key)
+    if os.path.exists(dest): return dest
+    with Image.open(src) as img:
+        img.draft("RGB", (size, size))
+        img = img.convert("RGB")
+        img.thumbnail((size, size))
+        storage.write_atomic(dest, lambda out: img.save(out, "WEBP", quality=80, method=4))
+    return dest
+
+def unlink(root: str, path: str):
+    for size in SIZES:
+        try:
+            os.remove(_thumb_path(root, key_for(path), size))
+        except FileNotFoundError:
+            pass
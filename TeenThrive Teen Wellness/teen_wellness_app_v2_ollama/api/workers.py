@@ -0,0 +1,109 @@
+"""Bounded executors for CPU-heavy request work.
+
+Work is handed to a process or thread pool so the event loop keeps serving
+other requests. Each pool admits at most `workers + queue_depth` calls at
+once; beyond that callers get a 503 with Retry-After instead of piling up.
+"""
+import asyncio, os
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Optional
+from fastapi import HTTPException
+
+class BoundedExecutor:
+    def __init__(self, name: str, workers: int, queue_depth: int, kind: str = "process", retry_after: int = 2):
+        self.name, self.workers, self.queue_depth = name, max(1, workers), max(0, queue_depth)
+        self.kind, self.retry_after = kind, retry_after
+        self.inflight = 0
+        self.rejected = self.broken = 0
+        self._pool: Optional[Executor] = None
+
+    def _executor(self) -> Executor:
+        # created lazily so importing the API never forks worker processes
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        return self._pool
+
+    async def run(self, fn, *args, **kwargs):
+        if self.inflight >= self.workers + self.queue_depth:
+            self.rejected += 1
+            raise HTTPException(503, f"{self.name} busy, retry shortly", headers={"Retry-After": str(self.retry_after)})
+        self.inflight += 1
+        pool = self._executor()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(pool, partial(fn, *args, **kwargs))
+        except BrokenProcessPool:
+            # a worker died (e.g. OOM-killed); the pool refuses all work from now on, so start over
+            self.broken += 1
+            if self._pool is pool:
+                self._pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise HTTPException(503, f"{self.name} restarting, retry shortly", headers={"Retry-After": str(self.retry_after)})
+        finally:
+            self.inflight -= 1
+
+    def stats(self) -> dict:
+        return {"kind": self.kind, "workers": self.workers, "queue_depth": self.queue_depth,
+                "inflight": self.inflight, "rejected": self.rejected, "broken": self.broken}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+_FEATURE_WORKERS = int(os.getenv("FEATURE_WORKERS", str(min(4, os.cpu_count() or 1))))
+feature_pool = BoundedExecutor(
+    "feature extraction",
+    workers=_FEATURE_WORKERS,
+    queue_depth=int(os.getenv("FEATURE_QUEUE_DEPTH", str(_FEATURE_WORKERS * 4))),
+    kind=os.getenv("FEATURE_EXECUTOR", "process"),
+)
+
+# bcrypt releases the GIL, so threads are enough; a dedicated pool keeps login bursts
+# from occupying the shared threadpool that serves every sync endpoint
+_PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+password_pool = BoundedExecutor(
+    "password hashing",
+    workers=_PASSWORD_WORKERS,
+    queue_depth=int(os.getenv("PASSWORD_QUEUE_DEPTH", str(_PASSWORD_WORKERS * 16))),
+    kind="thread",
+)
+
+class KeyedLimiter:
+    """Caps concurrent in-flight calls per key (e.g. client IP); excess gets 429 + Retry-After."""
+
+    def __init__(self, limit: int, retry_after: int = 1):
+        self.limit, self.retry_after = max(1, limit), retry_after
+        self._inflight: dict = defaultdict(int)
+
+    @asynccontextmanager
+    async def slot(self, key):
+        if self._inflight[key] >= self.limit:
+            raise HTTPException(429, "Too many concurrent requests", headers={"Retry-After": str(self.retry_after)})
+        self._inflight[key] += 1
+        try:
+            yield
+        finally:
+            self._inflight[key] -= 1
+            if not self._inflight[key]: del self._inflight[key]
+
+# a whole school or household can share one NAT address, so this only stops a single client hammering bcrypt
+login_limiter = KeyedLimiter(int(os.getenv("LOGIN_MAX_PER_IP", "16")))
+
+TRUSTED_PROXIES = {p.strip() for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()}
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str]) -> str:
+    """The caller's address: the TCP peer, or behind TRUSTED_PROXIES the last X-Forwarded-For hop they didn't add."""
+    ip = peer or "unknown"
+    if ip in TRUSTED_PROXIES and forwarded_for:
+        for hop in reversed([h.strip() for h in forwarded_for.split(",") if h.strip()]):
+            ip = hop
+            if hop not in TRUSTED_PROXIES: break
+    return ip
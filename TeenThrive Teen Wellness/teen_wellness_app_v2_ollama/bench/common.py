@@ -0,0 +1,55 @@
+"""Helpers shared by the HTTP benchmarks: a throwaway API server, test users and latency stats."""
+import asyncio, contextlib, os, socket, subprocess, sys, tempfile, time, uuid
+import httpx, numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+@contextlib.contextmanager
+def server(url: str = "", **env):
+    """Yield the base URL of `url`, or of a uvicorn started on a temporary database with `env` overrides."""
+    if url:
+        yield url.rstrip("/"); return
+    tmp = tempfile.mkdtemp(prefix="thriveteen-bench-")
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp}/bench.db", "STORAGE_DIR": f"{tmp}/storage",
+           "COACH_WARM_INTERVAL": "0", **{k: str(v) for k, v in env.items()}}
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=APP_DIR, env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(200):
+            with contextlib.suppress(httpx.HTTPError):
+                if httpx.get(base + "/health", timeout=1).status_code == 200: break
+            time.sleep(0.1)
+        else:
+            raise RuntimeError("API server did not start")
+        yield base
+    finally:
+        proc.terminate(); proc.wait(10)
+
+def register(base: str, password: str = "bench-password") -> tuple:
+    """Create a user; returns (email, password, auth headers)."""
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    r = httpx.post(base + "/auth/register", json={"email": email, "password": password}, timeout=30)
+    r.raise_for_status()
+    return email, password, {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+def percentiles(samples_ms) -> str:
+    if not samples_ms: return "no samples"
+    p50, p99 = np.percentile(samples_ms, [50, 99])
+    return f"n={len(samples_ms):<5} p50={p50:7.1f} ms  p99={p99:7.1f} ms  max={max(samples_ms):7.1f} ms"
+
+async def probe(client: httpx.AsyncClient, paths, headers, stop, interval: float = 0.02) -> dict:
+    """GET each path in turn until `stop` is set; returns path -> latencies in ms."""
+    lat = {p: [] for p in paths}
+    while not stop.is_set():
+        for p in paths:
+            t0 = time.perf_counter()
+            r = await client.get(p, headers=headers)
+            if r.status_code == 200: lat[p].append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(interval)
+    return lat
@@ -0,0 +1,76 @@
+"""SQLite write throughput and read latency: stock settings vs the pragmas in api/db.py.
+
+    python bench/db_write_bench.py                       # 1/4/8 writer threads, 5 s each
+    python bench/db_write_bench.py --writers 16 --seconds 10
+
+Each writer inserts journal entries, one transaction per row like the API
+does, while a reader runs the /journal/today query in a loop. "stock" is
+SQLite's default rollback journal with synchronous=FULL; both modes get the
+same busy_timeout so lock waits are counted as time, not errors.
+"""
+import argparse, os, sys, tempfile, threading, time
+import numpy as np
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session, create_engine, select
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/unused.db")  # keep api.db off the real database
+from api.db import SQLITE_PRAGMAS  # noqa: E402
+from api.models import JournalEntry, User  # noqa: E402
+
+MODES = {"stock": {"busy_timeout": SQLITE_PRAGMAS["busy_timeout"]}, "tuned": SQLITE_PRAGMAS}
+
+def make_engine(path: str, pragmas: dict):
+    eng = create_engine(f"sqlite:///{path}", pool_size=32, max_overflow=0,
+                        connect_args={"check_same_thread": False, "timeout": pragmas["busy_timeout"] / 1000})
+    @event.listens_for(eng, "connect")
+    def _set(dbapi_conn, _):
+        for name, value in pragmas.items(): dbapi_conn.execute(f"PRAGMA {name}={value}")
+    return eng
+
+def run(pragmas: dict, writers: int, seconds: float):
+    path = os.path.join(tempfile.mkdtemp(prefix="thriveteen-bench-"), "bench.db")
+    eng = make_engine(path, pragmas)
+    SQLModel.metadata.create_all(eng)
+    with Session(eng) as s:
+        users = [User(email=f"w{i}@example.com", password_hash="x") for i in range(writers)]
+        s.add_all(users); s.commit(); uids = [u.id for u in users]
+    stop, writes, errors, reads = threading.Event(), [0] * writers, [0] * writers, []
+
+    def writer(i):
+        while not stop.is_set():
+            try:
+                with Session(eng) as s:
+                    s.add(JournalEntry(user_id=uids[i], day="2026-01-01", note="bench " * 10)); s.commit()
+                writes[i] += 1
+            except Exception:
+                errors[i] += 1
+    def reader():
+        q = select(JournalEntry).where(JournalEntry.user_id == uids[0], JournalEntry.day == "2026-01-01") \
+            .order_by(JournalEntry.created_at.desc()).limit(20)
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            with Session(eng) as s: s.exec(q).all()
+            reads.append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)] + [threading.Thread(target=reader)]
+    for t in threads: t.start()
+    time.sleep(seconds); stop.set()
+    for t in threads: t.join()
+    eng.dispose()
+    return sum(writes) / seconds, sum(errors), np.percentile(reads, [50, 99]) if reads else (0, 0)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--writers", default="1,4,8")
+    ap.add_argument("--seconds", type=float, default=5)
+    args = ap.parse_args()
+    print(f"{'mode':>6} {'writers':>7} {'writes/s':>9} {'errors':>6} {'read p50 ms':>11} {'read p99 ms':>11}")
+    for n in (int(w) for w in args.writers.split(",")):
+        for mode, pragmas in MODES.items():
+            wps, errs, (p50, p99) = run(pragmas, n, args.seconds)
+            print(f"{mode:>6} {n:>7} {wps:>9.0f} {errs:>6} {p50:>11.2f} {p99:>11.2f}")
+
+if __name__ == "__main__":
+    main()
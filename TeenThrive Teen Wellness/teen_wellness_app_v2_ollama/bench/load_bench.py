@@ -0,0 +1,57 @@
+"""p50/p99 of light endpoints (/health, /todo) while photo uploads saturate the feature pool.
+
+    python bench/load_bench.py                          # starts its own API server on a temp database
+    python bench/load_bench.py --uploaders 16 --seconds 20
+    python bench/load_bench.py --url http://127.0.0.1:8000
+
+Uploads are camera-sized JPEGs sent for prediction. Compare the "idle" and
+"uploads" rows: with decoding off the event loop, light endpoints keep their
+latency and excess uploads get 503 + Retry-After instead of queueing.
+"""
+import argparse, asyncio, io, os, sys, time
+import httpx, numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import server, register, percentiles, probe  # noqa: E402
+
+def photo(seed: int, size=(4000, 3000)) -> bytes:
+    rng = np.random.default_rng(seed)
+    im = Image.fromarray(rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)).resize(size, Image.BICUBIC)
+    buf = io.BytesIO(); im.save(buf, "JPEG", quality=90); return buf.getvalue()
+
+async def uploader(client, headers, content, stop, counts):
+    while not stop.is_set():
+        r = await client.post("/items", files={"file": ("meal.jpg", content, "image/jpeg")}, headers=headers)
+        counts[r.status_code] = counts.get(r.status_code, 0) + 1
+        if r.status_code == 503: await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+
+async def phase(base, headers, uploaders: int, seconds: float, photos):
+    stop, counts = asyncio.Event(), {}
+    async with httpx.AsyncClient(base_url=base, timeout=60) as probe_client, \
+               httpx.AsyncClient(base_url=base, timeout=120, limits=httpx.Limits(max_connections=uploaders + 1)) as up_client:
+        tasks = [asyncio.create_task(uploader(up_client, headers, photos[i % len(photos)], stop, counts)) for i in range(uploaders)]
+        probe_task = asyncio.create_task(probe(probe_client, ["/health", "/todo"], headers, stop))
+        t0 = time.perf_counter()
+        await asyncio.sleep(seconds); stop.set()
+        lat = await probe_task
+        await asyncio.gather(*tasks)
+        return lat, counts, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", default="", help="benchmark a running API instead of starting one")
+    ap.add_argument("--uploaders", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=10)
+    args = ap.parse_args()
+    photos = [photo(i) for i in range(4)]
+    with server(args.url) as base:
+        _, _, headers = register(base)
+        httpx.post(base + "/todo", json={"title": "bench"}, headers=headers, timeout=30).raise_for_status()
+        for name, n in (("idle", 0), ("uploads", args.uploaders)):
+            lat, counts, elapsed = asyncio.run(phase(base, headers, n, args.seconds, photos))
+            for path, samples in lat.items(): print(f"{name:>8} {path:<8} {percentiles(samples)}")
+            if n: print(f"{'':>8} uploads  {counts.get(200, 0) / elapsed:.1f}/s ok, status counts {counts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Logins per second, and /health latency alongside them, at increasing login concurrency.
+
+    python bench/login_bench.py                             # BCRYPT_ROUNDS=12, 1/4/16/32 concurrent logins
+    python bench/login_bench.py --rounds 10 --concurrency 8,64 --seconds 5
+
+Every login comes from this machine's address, so concurrency above
+LOGIN_MAX_PER_IP shows up as 429s; the script raises the limit for its own
+server unless --url is given.
+"""
+import argparse, asyncio, os, sys, time
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import server, register, percentiles, probe  # noqa: E402
+
+async def run(base: str, email: str, password: str, concurrency: int, seconds: float):
+    stop, counts = asyncio.Event(), {}
+    async def login(client):
+        while not stop.is_set():
+            r = await client.post("/auth/login", json={"email": email, "password": password})
+            counts[r.status_code] = counts.get(r.status_code, 0) + 1
+            if r.status_code in (429, 503): await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=httpx.Limits(max_connections=concurrency)) as c, \
+               httpx.AsyncClient(base_url=base, timeout=60) as probe_client:
+        tasks = [asyncio.create_task(login(c)) for _ in range(concurrency)]
+        probe_task = asyncio.create_task(probe(probe_client, ["/health"], {}, stop))
+        t0 = time.perf_counter()
+        await asyncio.sleep(seconds); stop.set()
+        lat = await probe_task
+        await asyncio.gather(*tasks)
+    return counts, time.perf_counter() - t0, lat["/health"]
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", default="", help="benchmark a running API instead of starting one")
+    ap.add_argument("--rounds", type=int, default=12, help="BCRYPT_ROUNDS for the server this script starts")
+    ap.add_argument("--concurrency", default="1,4,16,32")
+    ap.add_argument("--seconds", type=float, default=10)
+    args = ap.parse_args()
+    with server(args.url, BCRYPT_ROUNDS=args.rounds, LOGIN_MAX_PER_IP=1000) as base:
+        email, password, _ = register(base)
+        print(f"{'concurrent':>10} {'logins/s':>9}  /health while logging in")
+        for n in (int(s) for s in args.concurrency.split(",")):
+            counts, elapsed, lat = asyncio.run(run(base, email, password, n, args.seconds))
+            print(f"{n:>10} {counts.get(200, 0) / elapsed:>9.1f}  {percentiles(lat)}  status counts {counts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Query latency of MatchIndex, pruned multi-index vs full scan, as the index grows.
+
+    python bench/match_index_bench.py                       # 1k, 10k, 100k
+    python bench/match_index_bench.py --sizes 1000,1000000  # 1M needs ~3.5 GB RAM (768 float32 per item)
+
+Items are random hashes around many cluster centres, roughly like a large photo
+catalog. The full scan is the same vectorized scoring over every row, which is
+what MatchIndex does below PRUNE_MIN_ITEMS.
+"""
+import argparse, os, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.match_index import MatchIndex, HASH_KEYS  # noqa: E402
+
+def build(n: int, rng) -> MatchIndex:
+    idx = MatchIndex(capacity=n)
+    centers = rng.integers(0, 2**63, size=(max(1, n // 20), 3))
+    hists = rng.random((256, 768), dtype=np.float32)
+    for i in range(n):
+        hv = centers[rng.integers(len(centers))] ^ (1 << rng.integers(0, 63, size=3))
+        idx.add(i + 1, 100, dict(zip(HASH_KEYS, (int(v) for v in hv))), hists[i % 256])
+    return idx, centers, hists
+
+def timed(fn, reps: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps): fn()
+    return (time.perf_counter() - t0) / reps * 1000
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+    print(f"{'items':>9} {'build s':>8} {'pruned ms':>10} {'full ms':>9} {'speedup':>8}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        t0 = time.perf_counter()
+        idx, centers, hists = build(n, rng)
+        build_s = time.perf_counter() - t0
+        queries = [(dict(zip(HASH_KEYS, (int(v) for v in centers[rng.integers(len(centers))]))), hists[rng.integers(256)])
+                   for _ in range(args.queries)]
+        it = iter(queries * 2)
+        pruned = timed(lambda: idx.matches(*next(it), k=5), args.queries)
+        q_rows = np.arange(len(idx))
+        def full():
+            q_hash, q_hist = next(it)
+            q = np.array([int(q_hash[k]) & (2**64 - 1) for k in HASH_KEYS], dtype=np.uint64)
+            idx._score(q_rows, q, np.asarray(q_hist, dtype=np.float32))
+        it = iter(queries * 2)
+        brute = timed(full, min(args.queries, 20 if n > 100_000 else args.queries))
+        print(f"{n:>9} {build_s:>8.1f} {pruned:>10.3f} {brute:>9.3f} {brute / pruned:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Coach time-to-first-token and prompt tokens evaluated per turn: stable prompt prefixes vs none.
+
+    python bench/ttft_bench.py                                  # Ollama at OLLAMA_URL (default 127.0.0.1:11434)
+    python bench/ttft_bench.py --model llama3.2:3b --turns 12
+
+Needs a running Ollama host with the model pulled. The same scripted
+conversation is played against two API servers: COACH_DIGEST_BLOCK=6 (the
+default, prompt prefix stable for six messages at a time) and
+COACH_DIGEST_BLOCK=1 (the window slides every turn). prompt_eval_count only
+counts tokens Ollama could not serve from its prompt cache, so fewer means
+more of the prefix was reused.
+"""
+import argparse, json, os, sys
+import httpx, numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import server, register  # noqa: E402
+
+QUESTIONS = ["What is a healthy breakfast before school?", "How much water should I drink on practice days?",
+             "Is it fine to skip lunch if I'm not hungry?", "Give me three snack ideas under 200 calories.",
+             "How can I get more protein without meat?", "What should I eat before a morning run?",
+             "How do I stop late night snacking?", "Are sports drinks better than water?",
+             "What is a quick dinner I can cook myself?", "How many hours of sleep do I need?",
+             "How do I eat more vegetables if I don't like them?", "What is a good post-workout meal?"]
+
+def turn(client: httpx.Client, headers: dict, message: str, conv_id):
+    """Send one question and return the done event's stats."""
+    body = {"message": message, "conversation_id": conv_id, "no_cache": True}
+    event = None
+    with client.stream("POST", "/coach/chat", json=body, headers=headers) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if line.startswith("event: "): event = line[7:]
+            elif line.startswith("data: ") and event in ("done", "error"):
+                data = json.loads(line[6:])
+                if event == "error": raise RuntimeError(data["detail"])
+                return data
+    raise RuntimeError("stream ended without a done event")
+
+def play(block: int, turns: int, model: str):
+    with server(COACH_DIGEST_BLOCK=block, COACH_MODELS=model, COACH_CACHE_SIZE=0, COACH_WARM_INTERVAL=240) as base:
+        _, _, headers = register(base)
+        with httpx.Client(base_url=base, timeout=300) as c:
+            turn(c, headers, "hello", None)  # loads the model so the first measured turn doesn't pay for it
+            stats, conv_id = [], None
+            for q in (QUESTIONS * 2)[:turns]:
+                s = turn(c, headers, q, conv_id)
+                conv_id = s["conversation_id"]; stats.append(s)
+    return stats
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--model", default=os.getenv("COACH_MODEL", "mistral:latest"))
+    ap.add_argument("--turns", type=int, default=10)
+    args = ap.parse_args()
+    print(f"{'block':>5} {'turn':>4} {'ttft ms':>8} {'prompt tokens evaluated':>24}")
+    summary = {}
+    for block in (6, 1):
+        stats = play(block, args.turns, args.model)
+        for i, s in enumerate(stats, 1): print(f"{block:>5} {i:>4} {s['ttft_ms']:>8} {s['prompt_eval_count'] or 0:>24}")
+        later = stats[1:]  # the first turn of a conversation has no prefix to reuse
+        summary[block] = (np.median([s["ttft_ms"] for s in later]), np.mean([s["prompt_eval_count"] or 0 for s in later]))
+    for block, (ttft, evals) in summary.items():
+        print(f"COACH_DIGEST_BLOCK={block}: median TTFT {ttft:.0f} ms, mean prompt tokens evaluated {evals:.0f} (turns 2+)")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import os
+import asyncio
+import threading
 import streamlit as st
 import httpx
-import datetime
 import pandas as pd
 import datetime as _dt
-import ollama
+import json
 import base64
 import random
 
@@ -20,10 +21,82 @@ CERT_PATH = "cert.pem"
 verify_param = CERT_PATH if VERIFY_TLS else False
 
 
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+                        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+                        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")))
+
+
+@st.cache_resource
+def _http_client(verify) -> httpx.Client:
+    # shared across reruns and sessions: keep-alive + HTTP/2 means one TLS handshake, not one per call
+    return httpx.Client(http2=True, verify=verify, timeout=60.0, limits=_limits())
+
+
+@st.cache_resource
+def _async_runtime(verify):
+    # AsyncClient pools are bound to an event loop, so keep one loop alive in a daemon thread
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop, httpx.AsyncClient(http2=True, verify=verify, timeout=60.0, limits=_limits())
+
+
+def _store_tokens(body: dict):
+    st.session_state["token"] = body["access_token"]
+    if body.get("refresh_token"):
+        st.session_state["refresh_token"] = body["refresh_token"]
+
+
+def _refresh() -> bool:
+    rt = st.session_state.get("refresh_token")
+    if not rt:
+        return False
+    r = _http_client(verify_param).post(api + "/auth/refresh", json={"refresh_token": rt})
+    if r.status_code != 200:
+        st.session_state.pop("token", None)
+        st.session_state.pop("refresh_token", None)
+        return False
+    _store_tokens(r.json())
+    return True
+
+
 def request(method: str, url: str, **kwargs):
-    kwargs.setdefault("timeout", 60.0)
-    kwargs.setdefault("verify", verify_param)
-    return httpx.request(method, url, **kwargs)
+    r = _http_client(verify_param).request(method, url, **kwargs)
+    # access tokens are short-lived: renew once with the refresh token and retry
+    if r.status_code == 401 and "Authorization" in (kwargs.get("headers") or {}) and _refresh():
+        kwargs["headers"] = {**kwargs["headers"], **headers()}
+        r = _http_client(verify_param).request(method, url, **kwargs)
+    return r
+
+
+def stream_events(url: str, payload: dict):
+    """Yield (event, data) pairs from a Server-Sent Events endpoint; renews the access token once on 401."""
+    for attempt in (0, 1):
+        with _http_client(verify_param).stream('POST', url, json=payload, headers=headers(),
+                                               timeout=httpx.Timeout(10.0, read=180.0)) as r:
+            if r.status_code == 401 and attempt == 0 and _refresh():
+                continue
+            if r.status_code != 200:
+                r.read()
+                yield "error", {"detail": r.text}
+                return
+            event = "message"
+            for line in r.iter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):])
+                    event = "message"
+            return
+
+
+def request_many(calls: list[tuple[str, str, dict]]) -> list:
+    """Run independent (method, url, kwargs) calls concurrently; failed calls come back as exceptions."""
+    loop, client = _async_runtime(verify_param)
+
+    async def run():
+        return await asyncio.gather(*(client.request(m, u, **kw) for m, u, kw in calls), return_exceptions=True)
+    return asyncio.run_coroutine_threadsafe(run(), loop).result()
 
 
 def headers():
@@ -47,7 +120,7 @@ with c1:
         r = request('POST', api + "/auth/register",
                     json={"email": email, "password": password})
         if r.status_code == 200:
-            st.session_state["token"] = r.json()["access_token"]
+            _store_tokens(r.json())
             st.success("Registered & logged in")
             st.rerun()
         else:
@@ -57,13 +130,16 @@ with c2:
         r = request('POST', api + "/auth/login",
                     json={"email": email, "password": password})
         if r.status_code == 200:
-            st.session_state["token"] = r.json()["access_token"]
+            _store_tokens(r.json())
             st.success("Logged in")
             st.rerun()
         else:
             st.error(r.text)
 with c3:
     if st.button("Logout"):
+        rt = st.session_state.pop("refresh_token", None)
+        if rt:
+            request('POST', api + "/auth/logout", json={"refresh_token": rt})
         st.session_state.pop("token", None)
         st.success("Logged out")
         st.rerun()
@@ -72,6 +148,14 @@ if "token" not in st.session_state:
     st.stop()
 st.markdown("</div>", unsafe_allow_html=True)
 
+# One round-trip for everything the page shows; actions below still call their own endpoints.
+offset = _local_tz_offset_minutes()
+dash_resp = request('GET', api + "/dashboard",
+                    params={"tz_offset_minutes": offset}, headers=headers())
+dash = dash_resp.json() if dash_resp.status_code == 200 else {}
+if dash_resp.status_code != 200:
+    st.error(dash_resp.text)
+
 
 # ---- Profile & BMI ----
 show_profile = st.toggle("Toggle to enter/change your profile", value=False)
@@ -80,8 +164,7 @@ if show_profile:
     st.markdown("<h2 style='color:#9b8cff;'>Profile & BMI</h2>",
                 unsafe_allow_html=True)
 
-    rp = request('GET', api + "/profile", headers=headers())
-    profile = rp.json() if rp.status_code == 200 else {}
+    profile = dash.get("profile") or {}
 
     def to_us_from_metric(cm: float | None, kg: float | None):
         cm = cm or 0.0
@@ -159,6 +242,8 @@ if show_profile:
     goal_default = int(profile.get("kcal_goal") or 2000)
     goal = st.number_input("Daily kcal goal", min_value=800,
                            max_value=4500, value=goal_default, step=50)
+    share_foods = st.checkbox("Share my food photos' calories with other users (get estimates from theirs too)",
+                              value=bool(profile.get("share_foods")))
 
     if st.button("Save profile"):
         cm, kg = to_metric_from_us(int(feet), float(inches), float(pounds))
@@ -166,6 +251,7 @@ if show_profile:
             "name": name, "gender": gender, "age_years": int(age),
             "height_cm": float(cm), "weight_kg": float(kg),
             "activity_level": activity_level, "kcal_goal": int(goal),
+            "share_foods": bool(share_foods),
         }, headers=headers())
         if r.status_code == 200:
             st.success("Profile saved")
@@ -187,12 +273,8 @@ st.markdown("<h2 style='color:#3478e5;'>Your Mood </h2>",
 
 # Gray #666
 
-offset = _local_tz_offset_minutes()
-
-ms = request('GET', api + "/mood/today",
-             params={"tz_offset_minutes": offset}, headers=headers())
-if ms.status_code == 200:
-    data = ms.json()
+data = dash.get("mood")
+if data:
     counts = data.get("counts", {}) or {}
     order = ["happy", "frustrated", "sad", "scared", "angry"]
     icons = {"happy": "😄", "frustrated": "😣",
@@ -265,9 +347,8 @@ with colBtn:
         else:
             st.info("Enter a task title.")
 
-lr = request('GET', api + "/todo", headers=headers())
-if lr.status_code == 200:
-    tasks = lr.json()
+tasks = dash.get("todo")
+if tasks is not None:
 
     def group(tasks, urgent=None, important=None):
         out = []
@@ -318,7 +399,7 @@ if lr.status_code == 200:
                     "Done", value=t["done"], key=f"done_{t['id']}")
                 if checked != t["done"]:
                     request(
-                        'PUT', api + f"/todo/{t['id']}", json={"done": bool(checked)}, headers=headers())
+                        'PUT', api + f"/todo/{t['id']}", json={"done": bool(checked), "tz_offset_minutes": _local_tz_offset_minutes()}, headers=headers())
                     st.rerun()
             with c3:
                 if st.button("Delete", key=f"del_t_{t['id']}"):
@@ -330,7 +411,7 @@ if lr.status_code == 200:
                     else:
                         st.error(dr.text)
 else:
-    st.error(lr.text)
+    st.warning("To-do list unavailable.")
 
 
 # ---- Activity Recommendations (with badges on complete) ----
@@ -339,19 +420,13 @@ st.markdown("<h2 style='color:#e85b81;'>Recommended Activities (based on your BM
             unsafe_allow_html=True)
 # Pink #e85b81
 
-rec = request('GET', api + "/activities/recommend",
-              params={"tz_offset_minutes": offset}, headers=headers())
-status = request('GET', api + "/activities/status_today",
-                 params={"tz_offset_minutes": offset}, headers=headers())
-
 done_keys = set()
-if status.status_code == 200:
-    for rstat in status.json():
-        if rstat["completed"]:
-            done_keys.add(rstat["key"])
+for rstat in dash.get("activities_status") or []:
+    if rstat["completed"]:
+        done_keys.add(rstat["key"])
 
-if rec.status_code == 200:
-    for a in rec.json():
+if dash.get("activities") is not None:
+    for a in dash["activities"]:
         box = st.container(border=True)
         c1, c2 = box.columns([6, 2])
         with c1:
@@ -373,10 +448,8 @@ else:
     st.warning("Recommendations unavailable.")
 
 # ---- Badges row (today) ----
-br = request('GET', api + "/badges/today",
-             params={"tz_offset_minutes": offset}, headers=headers())
-if br.status_code == 200:
-    badges = br.json()
+badges = dash.get("badges")
+if badges is not None:
     if badges:
         st.caption("Today's badges:")
         cols = st.columns(min(len(badges), 8))
@@ -392,13 +465,8 @@ st.divider()
 # Yellow #d4a017
 st.markdown("<h2 style='color:#d4a017;'>Current Calorie Counts</h2>",
             unsafe_allow_html=True)
-today = datetime.date.today().isoformat()
-offset = _local_tz_offset_minutes()
-
-dd = request('GET', api + "/summary/daily",
-             params={"date": today, "tz_offset_minutes": offset}, headers=headers()).json()
-ww = request('GET', api + "/summary/weekly",
-             params={"end": today, "tz_offset_minutes": offset}, headers=headers()).json()
+dd = dash.get("summary_daily") or {"total_calories": 0}
+ww = dash.get("summary_weekly") or {"total_calories": 0}
 m1, m2 = st.columns(2)
 m1.metric("Today", dd["total_calories"])
 m2.metric("This week", ww["total_calories"])
@@ -440,7 +508,8 @@ def predict_only(file_bytes: bytes):
 
 def save_with_calories(file_bytes: bytes, kcals: int):
     files = {"file": ("img.jpg", file_bytes, "image/jpeg")}
-    data = {"calories": str(int(kcals))}
+    data = {"calories": str(int(kcals)),
+            "tz_offset_minutes": str(_local_tz_offset_minutes())}
     return request('POST', api + "/items", files=files, data=data, headers=headers())
 
 
@@ -463,6 +532,9 @@ if st.session_state["cam_bytes"] is not None:
     if pred and pred["matched"]:
         st.success(
             f"Prediction: {pred['predicted_calories']} kcal (conf {pred['confidence']:.2f})")
+        if pred.get("source") == "catalog":
+            st.caption(
+                f"{pred['hint']} — spread ±{(pred.get('calorie_spread') or 0) // 2} kcal")
         s1, s2 = st.columns(2)
         with s1:
             if st.button("Save with predicted calories"):
@@ -506,28 +578,46 @@ if st.session_state["cam_bytes"] is not None:
 # ---- Food History ----
 st.markdown("<h2 style='color:#ffa552;'>Food History</h2>",
             unsafe_allow_html=True)
-r = request('GET', api + "/items", headers=headers())
-if r.status_code == 200:
-    rows = r.json()
+HISTORY_PAGE = 20
+if "hist_cursors" not in st.session_state:
+    st.session_state["hist_cursors"] = [None]  # one cursor per loaded page
+rows, next_cursor, history_error = [], None, None
+for cursor in st.session_state["hist_cursors"]:
+    if cursor is None and dash.get("items") is not None:
+        page = dash["items"]  # first page comes with the dashboard
+    else:
+        params = {"limit": HISTORY_PAGE, **({"cursor": cursor} if cursor else {})}
+        r = request('GET', api + "/items", params=params, headers=headers())
+        if r.status_code != 200:
+            history_error = r.text
+            break
+        page = r.json()
+    rows += page["items"]
+    next_cursor = page["next_cursor"]
+if history_error is None:
     if not rows:
         st.info("No items yet.")
     else:
-        for it in rows:
+        # thumbnails are independent, so fetch them all at once
+        thumbs = request_many([('GET', api + it["thumb_url"], {})
+                               for it in rows])
+        for it, img_resp in zip(rows, thumbs):
             cont = st.container(border=True)
             c1, c2, c3 = cont.columns([2, 4, 1])
             with c1:
                 try:
-                    img_resp = request('GET', api + it["image_url"])
+                    if isinstance(img_resp, Exception):
+                        raise img_resp
                     if img_resp.status_code == 200:
                         st.image(img_resp.content, width=160,
                                  caption=f"ID {it['id']}")
                     else:
                         st.warning(
                             f"Image fetch failed ({img_resp.status_code})")
-                        st.code(api + it["image_url"])
+                        st.code(api + it["thumb_url"])
                 except Exception as e:
                     st.warning(f"Image not available: {e}")
-                    st.code(api + it["image_url"])
+                    st.code(api + it["thumb_url"])
             with c2:
                 st.markdown(
                     f"**Calories:** {it['calories'] if it['calories'] is not None else '—'}")
@@ -542,8 +632,11 @@ if r.status_code == 200:
                         st.rerun()
                     else:
                         st.error(dr.text)
+        if next_cursor and st.button("Show older items"):
+            st.session_state["hist_cursors"].append(next_cursor)
+            st.rerun()
 else:
-    st.error(r.text)
+    st.error(history_error)
 
 # ---- Hydration Tracker (session-based MVP) ----
 st.divider()
@@ -617,10 +710,8 @@ with gj_col1:
         else:
             st.info("Write a short note first.")
 with gj_col2:
-    jr = request('GET', api + "/journal/today",
-                 params={"tz_offset_minutes": tzm}, headers=headers())
-    if jr.status_code == 200:
-        entries = jr.json()
+    entries = dash.get("journal")
+    if entries is not None:
         if not entries:
             st.caption("_No entries yet today._")
         else:
@@ -638,7 +729,7 @@ with gj_col2:
                     else:
                         st.error(dr.text)
     else:
-        st.error(jr.text)
+        st.warning("Journal unavailable.")
 
 
 # ---- Mini Chat bot (Ollama - local & free) ----
@@ -647,9 +738,27 @@ show_chat = st.toggle("Toggle for your personalized coach", value=False)
 st.markdown("<h2 style='color:#d4a017;'>Ask your personalized health coach about diet, fitness, or motivation</h2>", unsafe_allow_html=True)
 # Yellow #d4a017
 
-# Initialize chat history in session state
+# Initialize chat history in session state; transcripts are stored by the API
 if "messages" not in st.session_state:
     st.session_state.messages = []
+    st.session_state.conversation_id = None
+
+if show_chat:
+    conv_resp = request('GET', api + "/coach/conversations", headers=headers())
+    convs = conv_resp.json() if conv_resp.status_code == 200 else []
+    options = [None] + [c["id"] for c in convs]
+    titles = {c["id"]: f"{c['title']} ({c['updated_at'][:10]})" for c in convs}
+    current = st.session_state.conversation_id if st.session_state.conversation_id in options else None
+    picked = st.selectbox("Conversation", options, index=options.index(current),
+                          format_func=lambda cid: "New conversation" if cid is None else titles[cid])
+    if picked != st.session_state.conversation_id:
+        st.session_state.conversation_id = picked
+        st.session_state.messages = []
+        if picked is not None:
+            cr = request('GET', api + f"/coach/conversations/{picked}", headers=headers())
+            if cr.status_code == 200:
+                st.session_state.messages = [{"role": m["role"], "content": m["content"]}
+                                             for m in cr.json()["messages"]]
 
 # Display chat messages from history
 for message in st.session_state.messages:
@@ -658,44 +767,37 @@ for message in st.session_state.messages:
 
 # Handle user input
 if show_chat:
+    fresh = st.checkbox("Always generate a fresh answer", value=False,
+                        help="Skip the shared cache of answers to common questions")
     if prompt := st.chat_input("Ask local LLM..."):
-        # Add user message to history and display
-        if 'bmi' in globals():
-            final_prompt = "Given that my BMI is " + \
-                str(round(bmi, 1)) + ", " + prompt
-        else:
-            final_prompt = prompt
-
-        final_prompt = 'In short 3 point answers, ' + final_prompt
-
-        st.session_state.messages.append(
-            {"role": "user", "content": final_prompt})
+        # Store the question as typed; the API adds profile facts and trims history itself
+        st.session_state.messages.append({"role": "user", "content": prompt})
 
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        prompt = final_prompt
-        print(prompt)
-
-        # Get response from Llama 3 using Ollama
+        # Stream the reply from the API's coach endpoint (shared, queued Ollama host)
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
-                response_stream = ollama.chat(
-                    model="mistral:latest",
-                    messages=[
-                        {"role": m["role"], "content": m["content"]}
-                        for m in st.session_state.messages
-                    ],
-                    stream=True,
-                )
                 full_response = ""
                 placeholder = st.empty()
-                for chunk in response_stream:
-                    full_response += chunk["message"]["content"]
-                    # Add blinking cursor effect
-                    placeholder.markdown(full_response + "▌")
+                for event, data in stream_events(api + "/coach/chat", {
+                        "message": prompt, "conversation_id": st.session_state.conversation_id,
+                        "no_cache": fresh}):
+                    if event == "meta":
+                        st.session_state.conversation_id = data["conversation_id"]
+                    if event == "error":
+                        st.error(data.get("detail", "Coach unavailable"))
+                        break
+                    if event == "done" and data.get("cached"):
+                        st.caption("Answered from the coach's saved replies")
+                    if event == "message":
+                        full_response += data.get("delta", "")
+                        # Add blinking cursor effect
+                        placeholder.markdown(full_response + "▌")
                 placeholder.markdown(full_response)
 
             # Add assistant response to history
-            st.session_state.messages.append(
-                {"role": "assistant", "content": full_response})
+            if full_response:
+                st.session_state.messages.append(
+                    {"role": "assistant", "content": full_response})
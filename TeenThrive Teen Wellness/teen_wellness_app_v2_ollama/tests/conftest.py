@@ -0,0 +1,94 @@
+"""Test setup: a throwaway SQLite database and fast settings, fixed before `api` is imported."""
+import io, itertools, json, os, sys, tempfile
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="thriveteen-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'test.db')}")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("COACH_WARM_INTERVAL", "0")
+os.environ.setdefault("STORAGE_DIR", os.path.join(_tmp, "storage"))
+os.environ.setdefault("FEATURE_EXECUTOR", "thread")
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from api.main import app
+    with TestClient(app) as c:  # runs startup, i.e. the migrations
+        yield c
+
+_emails = itertools.count(1)
+
+@pytest.fixture
+def register(client):
+    """register(**profile) -> auth headers of a new user with that profile."""
+    def make(**profile):
+        r = client.post("/auth/register", json={"email": f"user{next(_emails)}@test.local", "password": "pw-123456"})
+        assert r.status_code == 200, r.text
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        if profile: assert client.put("/profile", json=profile, headers=headers).status_code == 200
+        return headers
+    return make
+
+@pytest.fixture
+def photo():
+    """photo(seed) -> JPEG bytes; blocky, so hashes survive re-encoding and equal seeds match."""
+    from PIL import Image
+    def make(seed: int) -> bytes:
+        small = np.random.default_rng(seed).integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(small).resize((256, 256), Image.NEAREST).save(buf, "JPEG", quality=90)
+        return buf.getvalue()
+    return make
+
+class MockOllama:
+    """In-process Ollama host: /api/chat streams NDJSON chunks of `reply`; every request body is recorded."""
+
+    def __init__(self, reply=("Drink ", "water ", "often."), status: int = 200):
+        self.reply, self.status, self.requests = list(reply), status, []
+
+    async def _chat_lines(self):
+        for part in self.reply:
+            yield (json.dumps({"message": {"role": "assistant", "content": part}, "done": False}) + "\n").encode()
+        yield (json.dumps({"message": {"role": "assistant", "content": ""}, "done": True, "prompt_eval_count": 42,
+                           "prompt_eval_duration": 5_000_000, "eval_count": len(self.reply)}) + "\n").encode()
+
+    async def handler(self, request):
+        import httpx
+        body = json.loads(request.content or b"{}")
+        self.requests.append((request.url.path, body))
+        if request.url.path == "/api/chat":
+            if self.status != 200: return httpx.Response(self.status, text="model exploded")
+            return httpx.Response(200, content=self._chat_lines())
+        if request.url.path == "/api/ps": return httpx.Response(200, json={"models": []})
+        return httpx.Response(200, json={})
+
+    def chats(self) -> list:
+        return [body for path, body in self.requests if path == "/api/chat"]
+
+@pytest.fixture
+def ollama(monkeypatch):
+    import httpx
+    from api import coach
+    mock = MockOllama()
+    monkeypatch.setattr(coach, "_client", httpx.AsyncClient(base_url="http://ollama.test", transport=httpx.MockTransport(mock.handler)))
+    return mock
+
+@pytest.fixture
+def sse_events():
+    def parse(text: str) -> list:
+        """Parse an SSE body into (event, data) pairs; comment frames come back as ("comment", text)."""
+        out = []
+        for frame in text.strip().split("\n\n"):
+            if frame.startswith(":"):
+                out.append(("comment", frame[1:].strip())); continue
+            event, data = "message", None
+            for line in frame.splitlines():
+                if line.startswith("event: "): event = line[7:]
+                elif line.startswith("data: "): data = json.loads(line[6:])
+            out.append((event, data))
+        return out
+    return parse
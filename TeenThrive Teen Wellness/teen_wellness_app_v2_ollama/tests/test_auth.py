@@ -0,0 +1,54 @@
+"""Refresh-token rotation, reuse detection and cleanup of old rows."""
+from datetime import datetime, timedelta
+from sqlmodel import Session, select
+
+from api import main
+from api.auth import REFRESH_REUSE_WINDOW, ACCESS_TOKEN_TTL
+from api.db import engine
+from api.models import RefreshToken
+
+def _refresh_of(client, headers):
+    # register() only keeps the access token; log in again for a refresh token
+    email = client.get("/profile", headers=headers).json()["email"]
+    return client.post("/auth/login", json={"email": email, "password": "pw-123456"}).json()["refresh_token"]
+
+def _family(token: str) -> str:
+    with Session(engine) as s:
+        return s.exec(select(RefreshToken.family).where(RefreshToken.token_hash == main.hash_refresh_token(token))).one()
+
+def test_reuse_revokes_family(client, register):
+    old = _refresh_of(client, register())
+    new = client.post("/auth/refresh", json={"refresh_token": old}).json()
+    assert client.get("/profile", headers={"Authorization": f"Bearer {new['access_token']}"}).status_code == 200
+    assert client.post("/auth/refresh", json={"refresh_token": old}).status_code == 401
+    assert client.get("/profile", headers={"Authorization": f"Bearer {new['access_token']}"}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": new["refresh_token"]}).status_code == 401
+
+def test_purge_drops_expired_and_stale_rotated_rows(client, register):
+    first = _refresh_of(client, register())
+    second = client.post("/auth/refresh", json={"refresh_token": first}).json()["refresh_token"]
+    third = _refresh_of(client, register())
+    fam = _family(first)
+    now = datetime.utcnow()
+    with Session(engine) as s:
+        for r in s.exec(select(RefreshToken).where(RefreshToken.family == fam)).all():
+            if r.revoked_at: r.revoked_at = now - timedelta(seconds=REFRESH_REUSE_WINDOW + 60)  # long-rotated
+            s.add(r)
+        r = s.exec(select(RefreshToken).where(RefreshToken.token_hash == main.hash_refresh_token(third))).one()
+        r.expires_at = now - timedelta(seconds=1); s.add(r)
+        s.commit()
+        main._purge_refresh_tokens(s)
+        left = set(s.exec(select(RefreshToken.token_hash).where(RefreshToken.family == fam)).all())
+        assert left == {main.hash_refresh_token(second)}  # only the live token of the session remains
+        assert not s.exec(select(RefreshToken).where(RefreshToken.token_hash == main.hash_refresh_token(third))).first()
+    assert client.post("/auth/refresh", json={"refresh_token": third}).status_code == 401
+
+def test_revoked_families_are_forgotten_after_access_ttl(client, register):
+    token = _refresh_of(client, register())
+    client.post("/auth/logout", json={"refresh_token": token})
+    fam = _family(token)
+    main.revoked_families.clear(); main.startup()  # a restarted worker reloads recent revocations
+    assert fam in main.revoked_families
+    main.revoked_families[fam] -= ACCESS_TOKEN_TTL + 1  # every access token of the family has expired by now
+    with Session(engine) as s: main._purge_refresh_tokens(s)
+    assert fam not in main.revoked_families
@@ -0,0 +1,14 @@
+"""POST /items/batch labels and predicts many photos with one index lookup."""
+from api import main
+
+def test_batch_syncs_user_index_once(client, register, photo, monkeypatch):
+    headers = register()
+    calls = []
+    real = main._user_index
+    monkeypatch.setattr(main, "_user_index", lambda session, uid: calls.append(uid) or real(session, uid))
+    # a new user's index is empty (len 0, so falsy); it must still be reused for every photo
+    files = [("files", (f"{i}.jpg", photo(100 + i), "image/jpeg")) for i in range(4)]
+    r = client.post("/items/batch", files=files, headers=headers)
+    assert r.status_code == 200, r.text
+    assert [p["matched"] for p in r.json()] == [False] * 4
+    assert len(calls) == 1
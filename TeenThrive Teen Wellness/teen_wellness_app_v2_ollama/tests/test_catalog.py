@@ -0,0 +1,40 @@
+"""Catalog predictions must not use items removed or unshared behind this worker's back."""
+from sqlmodel import Session, select
+
+from api.db import engine
+from api.models import FoodItem, User
+
+def _upload(client, headers, content: bytes, calories=None):
+    data = {} if calories is None else {"calories": str(calories)}
+    r = client.post("/items", files={"file": ("meal.jpg", content, "image/jpeg")}, data=data, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+def _owner_id(item_id: int) -> int:
+    with Session(engine) as s:
+        return s.get(FoodItem, item_id).user_id
+
+def test_catalog_drops_items_unshared_in_another_worker(client, register, photo):
+    sharer, asker = register(share_foods=True), register(share_foods=True)
+    img = photo(1)
+    item_id = _upload(client, sharer, img, calories=420)["saved_item_id"]
+    pred = _upload(client, asker, img)
+    assert pred["source"] == "catalog" and pred["predicted_calories"] == 420
+
+    with Session(engine) as s:  # opt-out written by another worker: this process's catalog never hears of it
+        u = s.get(User, _owner_id(item_id)); u.share_foods = False; s.add(u); s.commit()
+    assert _upload(client, asker, img)["matched"] is False
+
+def test_catalog_and_own_index_drop_rows_deleted_in_another_worker(client, register, photo):
+    sharer, asker = register(share_foods=True), register(share_foods=True)
+    img = photo(2)
+    item_id = _upload(client, sharer, img, calories=610)["saved_item_id"]
+    assert _upload(client, asker, img)["source"] == "catalog"
+    assert _upload(client, sharer, img)["match_item_id"] == item_id
+
+    with Session(engine) as s:
+        s.delete(s.get(FoodItem, item_id)); s.commit()
+    assert _upload(client, asker, img)["matched"] is False
+    assert _upload(client, sharer, img)["matched"] is False
+    with Session(engine) as s:
+        assert s.exec(select(FoodItem).where(FoodItem.id == item_id)).first() is None
@@ -0,0 +1,122 @@
+"""Coach chat: SSE relay from a mock Ollama host, and the fair scheduler's admission and ordering."""
+import asyncio
+import pytest
+from fastapi import HTTPException
+
+from api import coach, main
+from api.coach import FairScheduler
+
+def _uid(headers) -> int:
+    return main.decode_token(headers["Authorization"].split()[1])["uid"]
+
+def test_chat_relays_stream_and_saves_reply(client, register, ollama, sse_events):
+    headers = register()
+    r = client.post("/coach/chat", json={"message": "how much water should I drink", "no_cache": True}, headers=headers)
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(r.text)
+    assert events[0][0] == "meta" and events[1] == ("comment", "queued")
+    assert "".join(d["delta"] for e, d in events if e == "message") == "Drink water often."
+    event, done = events[-1]
+    assert event == "done" and done["prompt_eval_count"] == 42 and done["model"] == ollama.chats()[0]["model"]
+    assert ollama.chats()[0]["stream"] is True
+
+    conv = client.get(f"/coach/conversations/{done['conversation_id']}", headers=headers).json()
+    assert [(m["role"], m["content"]) for m in conv["messages"]] == [
+        ("user", "how much water should I drink"), ("assistant", "Drink water often.")]
+    assert coach.scheduler.active == 0 and coach.scheduler.waiting == 0
+
+def test_model_host_error_becomes_error_event(client, register, ollama, sse_events):
+    ollama.status = 500
+    r = client.post("/coach/chat", json={"message": "snack ideas?", "no_cache": True}, headers=register())
+    event, data = sse_events(r.text)[-1]
+    assert event == "error" and "500" in data["detail"]
+    assert coach.scheduler.active == 0
+
+def test_full_queue_answers_503(client, register, ollama, monkeypatch):
+    sched = FairScheduler(slots=1, queue_depth=0, per_user=1)
+    monkeypatch.setattr(coach, "scheduler", sched)
+    busy = sched.admit(999)  # someone else holds the only slot
+    r = client.post("/coach/chat", json={"message": "hi coach", "no_cache": True}, headers=register())
+    assert r.status_code == 503 and r.headers["Retry-After"]
+    assert not ollama.chats()
+    busy.release()
+    assert sched.active == 0
+
+def test_second_queued_question_from_same_user_answers_429(client, register, ollama, monkeypatch):
+    sched = FairScheduler(slots=1, queue_depth=8, per_user=1)
+    monkeypatch.setattr(coach, "scheduler", sched)
+    headers = register()
+    loop = asyncio.new_event_loop()
+    try:
+        busy = sched.admit(999)
+        async def enqueue(): return sched.admit(_uid(headers))
+        queued = loop.run_until_complete(enqueue())
+        r = client.post("/coach/chat", json={"message": "hi again", "no_cache": True}, headers=headers)
+        assert r.status_code == 429
+        queued.release(); busy.release()
+        assert sched.active == 0 and sched.waiting == 0
+    finally:
+        loop.close()
+
+def test_admission_never_exceeds_queue_depth():
+    async def run():
+        sched = FairScheduler(slots=2, queue_depth=3, per_user=10)
+        tickets, refused = [], 0
+        for i in range(10):  # all admitted before any of them starts streaming
+            try: tickets.append(sched.admit(i))
+            except HTTPException as e:
+                assert e.status_code == 503; refused += 1
+        assert (sched.active, sched.waiting, refused) == (2, 3, 5)
+        async def run_one(t):
+            async with t: await asyncio.sleep(0)
+        await asyncio.gather(*(run_one(t) for t in tickets))
+        assert (sched.active, sched.waiting) == (0, 0)
+    asyncio.run(run())
+
+def test_round_robin_lets_others_go_before_a_users_next_question():
+    async def run():
+        sched, order = FairScheduler(slots=1, queue_depth=10, per_user=2), []
+        admitted = [("a", sched.admit(1)), ("a2", sched.admit(1)), ("a3", sched.admit(1)), ("b", sched.admit(2)), ("c", sched.admit(3))]
+        async def run_one(name, t):
+            async with t:
+                order.append(name); await asyncio.sleep(0)
+        await asyncio.gather(*(run_one(n, t) for n, t in admitted))
+        return order
+    assert asyncio.run(run()) == ["a", "b", "c", "a2", "a3"]
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        sched = FairScheduler(slots=1, queue_depth=1, per_user=1)
+        holder, waiter = sched.admit(1), sched.admit(2)
+        async def wait():
+            async with waiter: pass
+        task = asyncio.create_task(wait()); await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError): await task
+        assert sched.waiting == 0
+        sched.admit(3).release()  # the queue place is free again
+        holder.release()
+        assert (sched.active, sched.waiting) == (0, 0)
+    asyncio.run(run())
+
+def test_stream_closed_before_its_slot_releases_the_ticket():
+    async def run():
+        sched = FairScheduler(slots=1, queue_depth=0, per_user=1)
+        gen = coach.stream_chat(sched.admit(1), [], "m")
+        await gen.__anext__()  # ": queued", then the client goes away
+        await gen.aclose()
+        assert sched.active == 0
+    asyncio.run(run())
+
+def test_model_is_routed_once_per_conversation(client, register, ollama, sse_events, monkeypatch):
+    monkeypatch.setattr(coach, "COACH_MODELS", ["small:1b", "large:7b"])
+    headers = register()
+    r = client.post("/coach/chat", json={"message": "water bottle size?", "no_cache": True}, headers=headers)
+    conv_id = sse_events(r.text)[-1][1]["conversation_id"]
+    # a long planning question would go to the large model if it opened a conversation
+    client.post("/coach/chat", json={"message": "Can you explain and plan a weekly routine for me?", "conversation_id": conv_id},
+                headers=headers)
+    assert [c["model"] for c in ollama.chats()] == ["small:1b", "small:1b"]
+    client.post("/coach/chat", json={"message": "Can you explain and plan a weekly routine for me?", "no_cache": True},
+                headers=headers)
+    assert ollama.chats()[-1]["model"] == "large:7b"
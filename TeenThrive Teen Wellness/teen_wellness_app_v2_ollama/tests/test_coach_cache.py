@@ -0,0 +1,38 @@
+"""Cached coach answers are shared between teens, so they must not be written from one teen's details."""
+PROFILE = dict(age_years=15, gender="female", height_cm=165, weight_kg=55, activity_level="high", kcal_goal=2350)
+
+def _ask(client, sse_events, headers, message, **extra):
+    r = client.post("/coach/chat", json={"message": message, **extra}, headers=headers)
+    assert r.status_code == 200
+    events = sse_events(r.text)
+    return "".join(d["delta"] for e, d in events if e == "message"), events[-1][1]
+
+def test_cacheable_answer_is_generated_without_personal_facts(client, register, ollama, sse_events):
+    alice = register(name="Alice", **PROFILE)
+    bob = register(name="Bob", **{**PROFILE, "age_years": 17, "weight_kg": 57, "kcal_goal": 2600})
+    question = "Healthy snack ideas for after volleyball?"
+
+    text, done = _ask(client, sse_events, alice, question)
+    system = ollama.chats()[0]["messages"][0]["content"]
+    for detail in ("Alice", "15", "female", "20.2", "2350"):
+        assert detail not in system
+    assert "healthy" in system and "high" in system  # the bucket the cache key is built from
+
+    again, done = _ask(client, sse_events, bob, "healthy snack ideas for after volleyball")
+    assert done.get("cached") is True and again.strip() == text.strip()
+    assert len(ollama.chats()) == 1
+
+def test_fresh_and_follow_up_answers_stay_personal(client, register, ollama, sse_events):
+    carol = register(name="Carol", **PROFILE)
+    _, done = _ask(client, sse_events, carol, "What should I eat before a match?", no_cache=True)
+    assert "Carol" in ollama.chats()[-1]["messages"][0]["content"]
+    _ask(client, sse_events, carol, "And after it?", conversation_id=done["conversation_id"])
+    assert "Carol" in ollama.chats()[-1]["messages"][0]["content"]
+
+def test_cacheable_conversation_keeps_its_system_message(client, register, ollama, sse_events):
+    dana = register(name="Dana", **PROFILE)
+    _, done = _ask(client, sse_events, dana, "Is pasta fine the night before a race?")
+    _ask(client, sse_events, dana, "What about breakfast?", conversation_id=done["conversation_id"])
+    first, follow_up = (c["messages"] for c in ollama.chats())
+    assert follow_up[0] == first[0] and "Dana" not in follow_up[0]["content"]
+    assert follow_up[:len(first)] == first  # the opening prompt is a prefix of the next one
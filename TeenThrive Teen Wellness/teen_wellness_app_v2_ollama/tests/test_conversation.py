@@ -0,0 +1,67 @@
+"""Coach prompt assembly: window/digest split, token budget and prefix stability."""
+from api import conversation
+from api.conversation import COACH_PROMPT_TOKENS, build, digest, estimate_tokens, system_prompt
+
+FACTS = conversation.profile_facts("Dana", 15, "female", 21.3, "healthy", "moderate", 2200)
+
+def _chat(n: int, size: int = 80) -> list:
+    """n messages alternating user/assistant, oldest first; each one distinct and about `size` characters."""
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i}. " + "x" * size} for i in range(n)]
+
+def _tokens(prompt: list) -> int:
+    return sum(estimate_tokens(m["content"]) for m in prompt)
+
+def test_window_starts_on_a_block_boundary():
+    msgs = _chat(21)  # cut = 21 - 6 = 15, rounded down to the block at 12
+    prompt = build(msgs, FACTS, history=6, block=6)
+    assert prompt[0]["role"] == "system" and prompt[1:] == msgs[12:]
+    assert "- Message 10." in prompt[0]["content"] and "Message 12." not in prompt[0]["content"]
+    assert build(msgs[:5], FACTS, history=6, block=6)[1:] == msgs[:5]  # short chats go in whole
+
+def test_window_starts_on_a_user_turn():
+    msgs = _chat(20)[1:]  # block boundaries now fall on assistant replies
+    prompt = build(msgs, FACTS, history=6, block=6)
+    assert prompt[1]["role"] == "user" and prompt[1:] == msgs[13:]
+
+def test_prompts_within_a_block_extend_each_other():
+    msgs = _chat(24)
+    prompts = {n: build(msgs[:n], FACTS, history=6, block=6) for n in range(13, 24, 2)}
+    for n in (13, 15, 19, 21):  # windows start at message 6, then at 12
+        assert prompts[n + 2][:len(prompts[n])] == prompts[n]
+    assert prompts[19][0] != prompts[17][0]  # crossing into the next block moves the digest once
+
+def test_long_chat_stays_within_budget():
+    sizes = []
+    for size in (80, 2000):
+        msgs = _chat(201, size)
+        for n in range(1, len(msgs) + 1, 2):
+            prompt = build(msgs[:n], FACTS)
+            assert _tokens(prompt) <= COACH_PROMPT_TOKENS, (size, n)
+            if size == 80: sizes.append(_tokens(prompt))
+    assert max(sizes[20:]) - min(sizes[20:]) < COACH_PROMPT_TOKENS // 4  # flat, not growing with the chat
+
+def test_oversized_question_is_clipped_to_fit():
+    older = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i:03d} " + "w" * 150} for i in range(20)]
+    question = {"role": "user", "content": "Why? " + "y" * 40000}
+    prompt = build(older + [question], FACTS)
+    assert len(prompt) == 2 and prompt[1]["content"].startswith("Why? ") and prompt[1]["content"].endswith("…")
+    assert digest(older) in prompt[0]["content"] and estimate_tokens(digest(older)) > 190  # the digest is full too
+    assert _tokens(prompt) <= COACH_PROMPT_TOKENS
+
+def test_tight_budget_keeps_the_newest_messages():
+    msgs = _chat(6, 400)
+    prompt = build(msgs, FACTS, budget=estimate_tokens(system_prompt(FACTS)) + conversation.COACH_DIGEST_TOKENS + 250)
+    assert prompt[1:] == msgs[4:]
+    assert "- Message 0." in prompt[0]["content"] and "- Message 2." in prompt[0]["content"]
+
+def test_digest_lists_first_sentences_of_questions_in_order():
+    older = [{"role": "user", "content": "What should I eat before football? I train at 6."},
+             {"role": "assistant", "content": "Try a banana. Also water."},
+             {"role": "user", "content": "How much sleep do I need"}]
+    assert digest(older) == "- What should I eat before football?\n- How much sleep do I need"
+
+def test_digest_keeps_newest_questions_within_budget():
+    older = [{"role": "user", "content": f"Question number {i} about snacks and sport"} for i in range(50)]
+    text = digest(older, budget=40)
+    assert sum(estimate_tokens(line) for line in text.split("\n")) <= 40
+    assert text.endswith("- Question number 49 about snacks and sport") and "number 0 " not in text
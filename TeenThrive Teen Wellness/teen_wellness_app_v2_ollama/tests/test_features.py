@@ -0,0 +1,64 @@
+"""Reduced-size decoding in compute_features must not change match decisions.
+
+`_baseline` is compute_features as it was before draft decoding: hashes and
+histogram from the full-resolution RGB image. Rows already in the database
+were computed that way, so new features are compared against it.
+"""
+import io
+import imagehash, numpy as np
+import pytest
+from PIL import Image, ImageEnhance
+
+from api.matcher import extract_features, match_confidence, _hash_distance, cosine_sim
+
+def _baseline(content: bytes):
+    im = Image.open(io.BytesIO(content)).convert("RGB")
+    hashes = {"phash": str(imagehash.phash(im)), "ahash": str(imagehash.average_hash(im)),
+              "dhash": str(imagehash.dhash(im))}
+    arr = np.array(im)
+    h = np.concatenate([np.histogram(arr[:, :, ch], bins=256, range=(0, 255))[0] for ch in range(3)]).astype(np.float32)
+    return hashes, h / (np.linalg.norm(h) + 1e-8)
+
+def _scene(seed: int, size) -> Image.Image:
+    """Smooth colour regions plus sensor-like noise, roughly what a phone photo of a plate looks like."""
+    rng = np.random.default_rng(seed)
+    im = np.asarray(Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize(size, Image.BICUBIC), dtype=np.float32)
+    noise = Image.fromarray(np.uint8(np.clip(rng.normal(128, 8, (size[1] // 4, size[0] // 4, 3)), 0, 255))).resize(size)
+    return Image.fromarray(np.uint8(np.clip(im + np.asarray(noise, dtype=np.float32) - 128, 0, 255)))
+
+def _encode(im: Image.Image, fmt: str = "JPEG", **kw) -> bytes:
+    buf = io.BytesIO(); im.save(buf, fmt, **kw); return buf.getvalue()
+
+@pytest.fixture(scope="module")
+def photos():
+    """name -> encoded bytes: camera-sized JPEGs, a re-shot variant of one, a PNG and a small JPEG."""
+    a, b = _scene(1, (3264, 2448)), _scene(2, (3264, 2448))
+    return {
+        "a": _encode(a, quality=90),
+        "a_again": _encode(ImageEnhance.Brightness(a).enhance(1.03), quality=75),
+        "b": _encode(b, quality=90),
+        "c_png": _encode(_scene(3, (2000, 1500)), "PNG"),
+        "d_small": _encode(_scene(4, (480, 360)), quality=90),
+    }
+
+@pytest.fixture(scope="module")
+def features(photos):
+    return {name: (_baseline(c), extract_features(c)) for name, c in photos.items()}
+
+def test_features_close_to_full_resolution(features):
+    for name, ((old_h, old_hist), (new_h, new_hist)) in features.items():
+        assert _hash_distance(old_h, new_h) <= 2, name
+        assert cosine_sim(old_hist, new_hist) >= 0.995, name
+
+def test_match_decisions_unchanged(features):
+    names = sorted(features)
+    decisions = 0
+    for q in names:
+        for db in names:
+            old_q, new_q = features[q]
+            old_db = features[db][0]  # stored rows keep their full-resolution features
+            want = match_confidence(*old_q, *old_db)[0]
+            assert match_confidence(*new_q, *old_db)[0] == want, (q, db)
+            assert match_confidence(*new_q, *features[db][1])[0] == want, (q, db)
+            decisions += want and q != db
+    assert decisions > 0  # the re-shot variant must actually match its original
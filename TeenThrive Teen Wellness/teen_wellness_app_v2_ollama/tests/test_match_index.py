@@ -0,0 +1,69 @@
+"""MatchIndex (pruned multi-index search) must agree with the brute-force match_confidence scan."""
+import numpy as np
+import pytest
+
+from api.match_index import IndexRegistry, MatchIndex, PRUNE_MIN_ITEMS
+from api.matcher import match_confidence
+
+def _hex(v: int) -> str:
+    return f"{v:016x}"
+
+def _flip(rng, v: int, bits: int) -> int:
+    for b in rng.choice(64, size=bits, replace=False): v ^= 1 << int(b)
+    return v
+
+def _dataset(rng, n_items: int, n_clusters: int = 40):
+    """Items in clusters of near-duplicate photos, so many queries land within the threshold."""
+    centers = [([int(x) for x in rng.integers(0, 2**63, size=3)], rng.random(768).astype(np.float32))
+               for _ in range(n_clusters)]
+    def sample():
+        hv, hist = centers[rng.integers(n_clusters)]
+        hashes = {k: _hex(_flip(rng, v, int(rng.integers(0, 6)))) for k, v in zip(("phash", "ahash", "dhash"), hv)}
+        h = hist + rng.random(768).astype(np.float32) * rng.uniform(0.05, 1.5)
+        return hashes, h / np.linalg.norm(h)
+    return sample
+
+def _brute(items, q_hash, q_hist):
+    hits = []
+    for item_id, cal, h, hist in items:
+        ok, conf, hd, _ = match_confidence(q_hash, q_hist, h, hist)
+        if ok: hits.append((item_id, cal, conf, hd))
+    return sorted(hits, key=lambda x: (-x[2], x[3], -x[0]))
+
+@pytest.mark.parametrize("n_items", [PRUNE_MIN_ITEMS - 1, 1500])
+def test_pruned_search_matches_brute_force(n_items):
+    rng = np.random.default_rng(n_items)
+    sample = _dataset(rng, n_items)
+    idx, items = MatchIndex(), []
+    for i in range(1, n_items + 1):
+        h, hist = sample()
+        items.append((i, int(rng.integers(50, 900)), h, hist))
+        idx.add(i, items[-1][1], h, hist)
+    # removals exercise the swap-remove and bucket bookkeeping
+    for i in rng.choice(np.arange(1, n_items + 1), size=n_items // 10, replace=False):
+        idx.remove(int(i))
+    live = [it for it in items if it[0] in idx._pos]
+
+    total_hits = 0
+    for _ in range(40):
+        q_hash, q_hist = sample()
+        got, want = idx.matches(q_hash, q_hist), _brute(live, q_hash, q_hist)
+        assert {g[0]: (g[1], g[3]) for g in got} == {w[0]: (w[1], w[3]) for w in want}
+        assert [g[2] for g in got] == pytest.approx([w[2] for w in want], abs=1e-4)  # same ranking, float32 scores
+        total_hits += len(want)
+    assert total_hits > 0  # the dataset must actually produce matches
+
+def test_registry_evicts_least_recently_used_and_reloads():
+    reg, loads = IndexRegistry(maxsize=2), []
+    def loader(uid):
+        def load(after_id):
+            loads.append((uid, after_id))
+            return [(1, 100, {"phash": "0" * 16, "ahash": "0" * 16, "dhash": "0" * 16}, np.ones(768, dtype=np.float32))] if after_id == 0 else []
+        return load
+    a = reg.get(1, loader(1)); reg.get(2, loader(2))
+    reg.get(1, loader(1))  # user 1 is now the most recent
+    reg.get(3, loader(3))
+    assert reg.peek(2) is None and reg.peek(1) is a and reg.evictions == 1
+    again = reg.get(2, loader(2))
+    assert len(again) == 1 and loads[-1] == (2, 0)  # rebuilt from scratch by its loader
+    assert reg.stats()["users"] == 2
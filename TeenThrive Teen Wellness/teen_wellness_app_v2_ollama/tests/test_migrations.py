@@ -0,0 +1,30 @@
+"""Upgrades from old schemas, including ones a previous run left half done."""
+import json, numpy as np
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, select
+
+from api import migrations
+from api.matcher import hash_to_int64, blob_to_hist
+from api.models import FoodItem
+
+def test_fooditem_rebuild_resumes_after_dying_between_rename_and_create():
+    mem = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(mem)
+    with mem.begin() as conn:  # version 1 done, then killed right after "ALTER TABLE fooditem RENAME TO fooditem_legacy"
+        conn.execute(text("DROP TABLE fooditem"))
+        conn.execute(text("CREATE TABLE fooditem_legacy (id INTEGER PRIMARY KEY, user_id INTEGER, path TEXT, calories INTEGER, "
+                          "phash TEXT, ahash TEXT, dhash TEXT, hist_json TEXT, created_at TIMESTAMP)"))
+        conn.execute(text("INSERT INTO fooditem_legacy VALUES (7, 1, 'a.jpg', 350, 'ffd8000000000001', '00000000000000ff', "
+                          ":d, :h, '2024-05-01 12:00:00')"), {"d": "8000000000000000", "h": json.dumps([0.6, 0.8])})
+    migrations.current_version(mem)
+    with mem.begin() as conn:
+        conn.execute(text("INSERT INTO schema_version (version, name) VALUES (1, 'create tables')"))
+
+    migrations.upgrade(mem)
+    assert "fooditem_legacy" not in inspect(mem).get_table_names()
+    with Session(mem) as s:
+        row = s.exec(select(FoodItem)).one()
+    assert (row.id, row.calories, row.day) == (7, 350, "2024-05-01")
+    assert (row.phash, row.dhash) == (hash_to_int64("ffd8000000000001"), hash_to_int64("8000000000000000"))
+    assert np.allclose(blob_to_hist(row.hist), [0.6, 0.8], atol=1e-3)
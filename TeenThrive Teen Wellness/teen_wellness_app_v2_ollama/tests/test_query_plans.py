@@ -0,0 +1,58 @@
+"""Every SELECT behind the per-user read endpoints is answered from an index.
+
+The schema comes from migrations.upgrade on an in-memory database, so the
+plans are those of a migrated install. A plan fails on a full table scan
+("SCAN <table>" without an index) or a sort it has to build ("USE TEMP B-TREE").
+"""
+import re
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session
+
+from api import main, migrations
+
+READ_ENDPOINTS = ["/dashboard", "/mood/today", "/todo", "/journal/today", "/activities/status_today",
+                  "/activities/recommend", "/badges/today", "/items", "/summary/daily", "/summary/weekly",
+                  "/summary/range", "/coach/conversations"]
+
+@pytest.fixture
+def mem_client(client):
+    mem = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    migrations.upgrade(mem)
+    def session():
+        with Session(mem) as s: yield s
+    main.app.dependency_overrides[main.get_session] = session
+    main.user_cache.clear()  # user ids restart at 1 in this database
+    try:
+        yield client, mem
+    finally:
+        main.app.dependency_overrides.clear(); main.user_cache.clear()
+
+def _bad_steps(conn, statement, params):
+    plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params).all()
+    return [row[-1] for row in plan if "USE TEMP B-TREE" in row[-1] or re.fullmatch(r"SCAN \w+", row[-1])]
+
+def test_read_endpoints_use_indexes(mem_client):
+    client, mem = mem_client
+    r = client.post("/auth/register", json={"email": "plans@test.local", "password": "pw-123456"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    client.post("/mood/set", json={"mood": "happy"}, headers=headers)
+    client.post("/todo", json={"title": "homework"}, headers=headers)
+    client.post("/journal/add", json={"note": "a good day"}, headers=headers)
+    client.post("/activities/complete", data={"key": "walk", "title": "Walk"}, headers=headers)
+
+    seen = []
+    def capture(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"): seen.append((statement, params))
+    event.listen(mem, "before_cursor_execute", capture)
+    try:
+        for path in READ_ENDPOINTS:
+            assert client.get(path, headers=headers).status_code == 200, path
+    finally:
+        event.remove(mem, "before_cursor_execute", capture)
+
+    assert seen
+    with mem.connect() as conn:
+        bad = {stmt: steps for stmt, params in seen if (steps := _bad_steps(conn, stmt, params))}
+    assert not bad, "\n\n".join(f"{stmt}\n  -> {steps}" for stmt, steps in bad.items())
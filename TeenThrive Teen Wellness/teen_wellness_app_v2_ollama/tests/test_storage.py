@@ -0,0 +1,27 @@
+"""Stored photos and thumbnails: permissions, and no live row left without its file."""
+import io, os, stat
+from PIL import Image
+
+from api import storage, thumbs
+
+def _jpeg() -> bytes:
+    buf = io.BytesIO(); Image.new("RGB", (64, 48), (200, 120, 40)).save(buf, "JPEG"); return buf.getvalue()
+
+def test_files_get_umask_permissions(tmp_path):
+    rel = storage.put(str(tmp_path), _jpeg())
+    thumb = thumbs.ensure(str(tmp_path), thumbs.key_for(rel), 160)
+    for path in (tmp_path / rel, thumb):
+        assert stat.S_IMODE(os.stat(path).st_mode) == storage.FILE_MODE
+    assert not [p for p in tmp_path.rglob(".tmp-*")]
+
+def test_release_keeps_file_for_row_saved_during_delete(tmp_path):
+    content = _jpeg()
+    rel = storage.put(str(tmp_path), content)
+    def upload_commits_meanwhile():  # the deleter's count saw 0, then another upload of the same photo landed
+        storage.put(str(tmp_path), content)
+        return True
+    assert storage.release(str(tmp_path), rel, upload_commits_meanwhile) is False
+    assert (tmp_path / rel).read_bytes() == content
+    assert storage.release(str(tmp_path), rel, lambda: False) is True
+    assert not (tmp_path / rel).exists() and not [p for p in tmp_path.rglob(".del-*")]
+    assert storage.release(str(tmp_path), rel, lambda: False) is False  # already gone
@@ -0,0 +1,37 @@
+"""Thumbnail keys must name a stored photo; anything else is a 404 with nothing written."""
+import os
+import pytest
+
+from api import main, storage, thumbs
+
+@pytest.fixture
+def outside(tmp_path, photo):
+    """A decodable JPEG outside the storage root, where a traversal would find it."""
+    d = tmp_path / "outside"; d.mkdir()
+    (d / "secret.jpg").write_bytes(photo(7))
+    return d
+
+@pytest.mark.parametrize("path", [
+    "/static/thumbs/160/{d}/secret.webp",
+    "/static/thumbs/160/{enc}%2Fsecret.webp",
+    "/static/thumbs/160/../../{d}/secret.webp",
+    "/static/thumbs/160/..%2F..%2F..%2F{enc}%2Fsecret.webp",
+    "/static/thumbs/160/aa/bb/{d}/secret.webp",
+])
+def test_traversal_is_refused(client, outside, path):
+    url = path.format(d=str(outside).lstrip("/"), enc=str(outside).replace("/", "%2F"))
+    assert client.get(url).status_code == 404
+    assert sorted(os.listdir(outside)) == ["secret.jpg"]
+
+def test_stored_photo_thumbnail(client, photo):
+    rel = storage.put(main.STORAGE_DIR, photo(8))
+    r = client.get(thumbs.url_for(rel, 160))
+    assert r.status_code == 200 and r.headers["content-type"] == "image/webp"
+
+@pytest.mark.parametrize("key", ["1712345678901_upload", "ab/cd/abcd" + "0" * 60])
+def test_valid_keys(key):
+    assert thumbs.valid_key(key)
+
+@pytest.mark.parametrize("key", ["", "/tmp/x", "../x", "ab/cd/" + "0" * 64, "ab/cd/abcd" + "0" * 59, ".hidden", "a/b"])
+def test_invalid_keys(key):
+    assert not thumbs.valid_key(key)
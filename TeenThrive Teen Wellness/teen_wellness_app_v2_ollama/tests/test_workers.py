@@ -0,0 +1,54 @@
+"""Bounded pools and the per-client login limiter."""
+import asyncio, os, threading
+import pytest
+from fastapi import HTTPException
+
+from api import workers
+from api.workers import BoundedExecutor, KeyedLimiter, client_ip
+
+def test_client_ip_ignores_forwarded_for_from_untrusted_peer(monkeypatch):
+    monkeypatch.setattr(workers, "TRUSTED_PROXIES", {"10.0.0.1"})
+    assert client_ip("203.0.113.9", "1.2.3.4") == "203.0.113.9"
+    assert client_ip(None, None) == "unknown"
+
+def test_client_ip_behind_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(workers, "TRUSTED_PROXIES", {"10.0.0.1", "10.0.0.2"})
+    # the left-most entries are client-controlled; take the last hop our proxies did not add
+    assert client_ip("10.0.0.1", "6.6.6.6, 198.51.100.7, 10.0.0.2") == "198.51.100.7"
+    assert client_ip("10.0.0.1", "") == "10.0.0.1"
+
+def test_keyed_limiter_caps_concurrency_per_key():
+    async def run():
+        lim, gate = KeyedLimiter(2), asyncio.Event()
+        async def hold(key):
+            async with lim.slot(key): await gate.wait()
+        tasks = [asyncio.create_task(hold("a")) for _ in range(2)] + [asyncio.create_task(hold("b"))]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as e:
+            async with lim.slot("a"): pass
+        assert e.value.status_code == 429
+        gate.set(); await asyncio.gather(*tasks)
+        async with lim.slot("a"): pass  # freed again
+    asyncio.run(run())
+
+def test_full_pool_answers_503():
+    async def run():
+        pool, gate = BoundedExecutor("test", workers=1, queue_depth=1, kind="thread"), threading.Event()
+        busy = [asyncio.create_task(pool.run(gate.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as e: await pool.run(pow, 2, 3)
+        assert e.value.status_code == 503 and e.value.headers["Retry-After"] and pool.rejected == 1
+        gate.set(); await asyncio.gather(*busy)
+        assert await pool.run(pow, 2, 3) == 8
+        pool.shutdown()
+    asyncio.run(run())
+
+def test_dead_worker_process_is_replaced():
+    async def run():
+        pool = BoundedExecutor("test", workers=1, queue_depth=1, kind="process")
+        with pytest.raises(HTTPException) as e: await pool.run(os._exit, 1)  # like an OOM kill mid-decode
+        assert e.value.status_code == 503 and e.value.headers["Retry-After"]
+        assert await pool.run(pow, 2, 3) == 8  # a fresh pool serves the next call
+        assert pool.stats()["broken"] == 1
+        pool.shutdown()
+    asyncio.run(run())